@@ -0,0 +1,97 @@
+import asyncio
+import logging
+import weakref
+import contextlib
+
+import aiohttp
+import openai
+
+from logging_config import setup_logging
+
+setup_logging()  # Ensure the logger is set up
+logger = logging.getLogger(__name__)
+
+# Maximum number of open connections, in total and per host
+CONNECTION_LIMIT = 100
+CONNECTION_LIMIT_PER_HOST = 50
+
+# One session (and connection pool) per event loop
+_sessions = weakref.WeakKeyDictionary()
+# Number of holders of the session of each event loop (see `acquire_session`)
+_holders = weakref.WeakKeyDictionary()
+
+
+def get_session() -> aiohttp.ClientSession:
+    """
+    Returns the HTTP session of the running event loop, creating it on first use.
+
+    All the async API wrappers share this session, so their requests reuse the same pooled
+    connections. The session is also registered as the aiohttp session of the openai library.
+
+    Returns:
+        aiohttp.ClientSession: The shared session.
+    """
+    loop = asyncio.get_running_loop()
+    session = _sessions.get(loop)
+    if session is None or session.closed:
+        connector = aiohttp.TCPConnector(limit=CONNECTION_LIMIT, limit_per_host=CONNECTION_LIMIT_PER_HOST)
+        session = aiohttp.ClientSession(connector=connector)
+        _sessions[loop] = session
+        logger.info("Created shared async HTTP session.")
+    openai.aiosession.set(session)
+    return session
+
+
+def acquire_session() -> aiohttp.ClientSession:
+    """
+    Returns the HTTP session of the running event loop and holds it open until `release_session`
+    is called as many times as it was acquired.
+
+    Returns:
+        aiohttp.ClientSession: The shared session.
+    """
+    loop = asyncio.get_running_loop()
+    _holders[loop] = _holders.get(loop, 0) + 1
+    return get_session()
+
+
+async def release_session():
+    """
+    Releases a hold taken with `acquire_session`. The session is closed when the last holder
+    releases it, so a client leaving its `async with` block does not close the session under
+    the requests of the other clients still holding it.
+    """
+    loop = asyncio.get_running_loop()
+    holders = _holders.get(loop, 0) - 1
+    if holders > 0:
+        _holders[loop] = holders
+        return
+    _holders.pop(loop, None)
+    await close_session()
+
+
+@contextlib.asynccontextmanager
+async def hold_session():
+    """
+    Holds the session of the running event loop open inside the block, so the requests sent in it
+    are not cut off by another client releasing the session.
+
+    Yields:
+        aiohttp.ClientSession: The shared session.
+    """
+    session = acquire_session()
+    try:
+        yield session
+    finally:
+        await release_session()
+
+
+async def close_session():
+    """
+    Closes the HTTP session of the running event loop, if any, whoever still uses it. Only the code
+    owning the event loop should call it, before the loop ends.
+    """
+    _holders.pop(asyncio.get_running_loop(), None)
+    session = _sessions.pop(asyncio.get_running_loop(), None)
+    if session is not None and not session.closed:
+        await session.close()
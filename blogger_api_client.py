@@ -1,5 +1,10 @@
 import os
+import asyncio
 import logging
+import threading
+import aiohttp
+from async_http import hold_session
+from cassette import REPLAY_TOKEN, replaying
 from logging_config import setup_logging
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
@@ -12,11 +17,61 @@ logger = logging.getLogger(__name__)
 
 # SCOPES for Blogger API
 SCOPES = ['https://www.googleapis.com/auth/blogger']
+# Blogger REST endpoint used by the async methods
+POSTS_URL = 'https://www.googleapis.com/blogger/v3/blogs/{blog_id}/posts/'
+
+# Credentials shared by all the threads of the process, loaded by the first call to get_credentials
+_credentials = None
+_credentials_lock = threading.Lock()
+# Blogger service of each thread (httplib2, used by googleapiclient, is not thread-safe)
+_services = threading.local()
+# Credentials used while a cassette is replayed
+_REPLAY_CREDENTIALS = Credentials(token=REPLAY_TOKEN)
+
 
 def get_credentials() -> Credentials:
     """
     Obtain credentials for the Blogger API using OAuth 2.0.
 
+    The credentials are loaded once per process and shared by all the threads. They are loaded
+    again, and `token.json` rewritten, only when they are no longer valid. While a cassette is
+    replayed, static credentials are returned and `token.json` is neither read nor refreshed.
+
+    Returns:
+        google.oauth2.credentials.Credentials: OAuth 2.0 credentials.
+
+    Raises:
+        FileNotFoundError: If the client secret file is not found.
+        Exception: If any error occurs during the authentication process.
+    """
+    global _credentials
+    if replaying():
+        return _REPLAY_CREDENTIALS
+    with _credentials_lock:
+        if _credentials is None or not _credentials.valid:
+            _credentials = _load_credentials()
+        return _credentials
+
+
+def get_service(creds: Credentials):
+    """
+    Returns the Blogger API client of the current thread for the credentials, building it on first use,
+    so the jobs run by a worker thread reuse the same client and connections.
+
+    Args:
+        creds (google.oauth2.credentials.Credentials): OAuth 2.0 credentials.
+
+    Returns:
+        googleapiclient.discovery.Resource: API client for Blogger API.
+    """
+    if getattr(_services, 'creds', None) is not creds:
+        _services.service = build('blogger', 'v3', credentials=creds)
+        _services.creds = creds
+    return _services.service
+
+
+def _load_credentials() -> Credentials:
+    """
     Loads the credentials from `token.json` if they exist. If not, it opens
     a browser window for the user to sign in and authorize the application.
 
@@ -88,7 +143,29 @@ class BlogPost:
         self.blog_id = blog_id
         self.title = title
         self.content = content
-        self.service = build('blogger', 'v3', credentials=creds)
+        self.creds = creds
+        self.service = get_service(creds)
+
+    def _post_body(self, new: bool) -> dict:
+        """
+        Validates the title and content and builds the body sent by the sync and async methods.
+
+        Args:
+            new (bool): Whether the body creates a post (with its kind) or patches one.
+
+        Returns:
+            dict: The post body.
+
+        Raises:
+            ValueError: If the title or content is empty.
+        """
+        if not self.title.strip() or not self.content.strip():
+            logger.error("Post title or content is empty.")
+            raise ValueError("Title and content must not be empty.")
+
+        post_body = {'kind': 'blogger#post'} if new else {}
+        post_body.update(title=self.title, content=self.content)
+        return post_body
 
     def create_post(self) -> tuple:
         """
@@ -103,17 +180,9 @@ class BlogPost:
             HttpError: If an error occurs related to the Blogger API.
             Exception: Any other errors that occur during execution.
         """
-        if not self.title.strip() or not self.content.strip():
-            logger.error("Post title or content is empty.")
-            raise ValueError("Title and content must not be empty.")
+        post_body = self._post_body(new=True)
 
         try:
-            post_body = {
-                'kind': 'blogger#post',
-                'title': self.title,
-                'content': self.content,
-            }
-
             post = self.service.posts().insert(blogId=self.blog_id, body=post_body).execute()
             logger.info(f"Post published successfully: {post['url']}")
             return post['id'], post['url']
@@ -124,3 +193,91 @@ class BlogPost:
         except Exception as e:
             logger.error(f"Error while publishing post: {e}")
             raise
+
+    def update_post(self, post_id: str) -> tuple:
+        """
+        Update an existing post in place with the title and content defined in the instance.
+
+        Only the title and content are sent, using the Blogger `posts().patch` method.
+
+        Args:
+            post_id (str): The ID of the post to update.
+
+        Returns:
+            tuple: A tuple containing the ID and URL of the updated post.
+
+        Raises:
+            HttpError: If an error occurs related to the Blogger API.
+            Exception: Any other errors that occur during execution.
+        """
+        post_body = self._post_body(new=False)
+
+        try:
+            post = self.service.posts().patch(blogId=self.blog_id, postId=post_id, body=post_body).execute()
+            logger.info(f"Post updated successfully: {post['url']}")
+            return post['id'], post['url']
+
+        except HttpError as http_err:
+            logger.error(f"HTTP error while updating post: {http_err.resp.status} - {http_err.content}")
+            raise
+        except Exception as e:
+            logger.error(f"Error while updating post: {e}")
+            raise
+
+    async def acreate_post(self) -> tuple:
+        """
+        Async version of `create_post`, using the shared async HTTP session.
+
+        Returns:
+            tuple: A tuple containing the ID and URL of the created post.
+
+        Raises:
+            aiohttp.ClientResponseError: If an error occurs related to the Blogger API.
+            Exception: Any other errors that occur during execution.
+        """
+        post_body = self._post_body(new=True)
+        post = await self._arequest('POST', POSTS_URL.format(blog_id=self.blog_id), post_body, 'publishing')
+        logger.info(f"Post published successfully: {post['url']}")
+        return post['id'], post['url']
+
+    async def aupdate_post(self, post_id: str) -> tuple:
+        """
+        Async version of `update_post`, using the shared async HTTP session.
+
+        Args:
+            post_id (str): The ID of the post to update.
+
+        Returns:
+            tuple: A tuple containing the ID and URL of the updated post.
+
+        Raises:
+            aiohttp.ClientResponseError: If an error occurs related to the Blogger API.
+            Exception: Any other errors that occur during execution.
+        """
+        post_body = self._post_body(new=False)
+        url = POSTS_URL.format(blog_id=self.blog_id) + post_id
+        post = await self._arequest('PATCH', url, post_body, 'updating')
+        logger.info(f"Post updated successfully: {post['url']}")
+        return post['id'], post['url']
+
+    async def _arequest(self, method: str, url: str, post_body: dict, action: str) -> dict:
+        """Sends a request to the Blogger REST API with the instance credentials and returns the post."""
+        try:
+            if not self.creds.valid:
+                # The refresh is a blocking request, keep it off the event loop
+                await asyncio.to_thread(self.creds.refresh, Request())
+                logger.info('Access token refreshed.')
+
+            headers = {'Authorization': f'Bearer {self.creds.token}'}
+            async with hold_session() as session, \
+                    session.request(method, url, json=post_body, headers=headers) as response:
+                if response.status >= 400:
+                    logger.error(f"HTTP error while {action} post: {response.status} - {await response.text()}")
+                response.raise_for_status()
+                return await response.json()
+
+        except aiohttp.ClientResponseError:
+            raise
+        except Exception as e:
+            logger.error(f"Error while {action} post: {e}")
+            raise
@@ -0,0 +1,491 @@
+import os
+import io
+import json
+import mmap
+import time
+import asyncio
+import zlib
+import base64
+import struct
+import hashlib
+import logging
+import threading
+import contextlib
+import http.client
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+import aiohttp
+import httplib2
+import requests
+from multidict import CIMultiDict, CIMultiDictProxy
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+from yarl import URL
+
+from logging_config import setup_logging
+
+setup_logging()  # Ensure the logger is set up
+logger = logging.getLogger(__name__)
+
+# Request fields that change between runs without changing the response we care about
+# (e.g. the OpenAI temperature is random on every call)
+DEFAULT_IGNORED_FIELDS = ('temperature',)
+
+# Response headers that no longer apply once the body has been decoded and stored
+_DROPPED_HEADERS = ('content-encoding', 'content-length', 'transfer-encoding')
+
+# Index entry: SHA-256 digest of the request key, offset and length of the compressed record
+_INDEX_ENTRY = struct.Struct('>32sQI')
+
+# Token fields of OAuth responses, replaced before the responses are stored
+_TOKEN_FIELDS = ('access_token', 'refresh_token', 'id_token')
+_SCRUBBED = '<scrubbed>'
+
+# Static token used by the API clients while a cassette is replayed, instead of their real credentials
+REPLAY_TOKEN = 'cassette-replay-token'
+
+# The active cassette, or None outside a use_cassette block
+_active = None
+
+_original_adapter_send = HTTPAdapter.send
+_original_http_request = httplib2.Http.request
+_original_session_request = aiohttp.ClientSession._request
+
+
+class CassetteMissError(LookupError):
+    """
+    Raised in replay mode when a request has no recorded response.
+    """
+
+
+def replaying() -> bool:
+    """
+    Returns whether a cassette is being replayed. The API clients then authenticate with
+    REPLAY_TOKEN instead of loading or refreshing their credentials, since a token refresh was
+    never recorded and would overwrite the real token files.
+
+    Returns:
+        bool: True inside a replay `use_cassette` block.
+    """
+    return _active is not None and _active.mode == 'replay'
+
+
+def _scrub_tokens(content: bytes) -> bytes:
+    """Replaces the OAuth tokens of a JSON response body, so live tokens never end up in a cassette."""
+    try:
+        data = json.loads(content)
+    except ValueError:
+        return content
+    if not isinstance(data, dict) or not any(field in data for field in _TOKEN_FIELDS):
+        return content
+    data.update((field, _SCRUBBED) for field in _TOKEN_FIELDS if field in data)
+    return json.dumps(data).encode('utf-8')
+
+
+def normalize_request(method: str, url: str, body=None, ignored_fields=DEFAULT_IGNORED_FIELDS) -> str:
+    """
+    Builds a normalized representation of a request, used as the cassette key.
+
+    Query parameters are sorted, JSON bodies are re-serialized with sorted keys and form bodies
+    are sorted; the ignored fields are dropped from the query string and the body. Headers are
+    not part of the key, so credentials never end up in it.
+
+    Args:
+        method (str): The HTTP method.
+        url (str): The request URL.
+        body (bytes | str): The request body, if any.
+        ignored_fields (tuple): Query or body fields left out of the key.
+
+    Returns:
+        str: The normalized request.
+    """
+    parts = urlsplit(url)
+    query = sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k not in ignored_fields)
+    normalized_url = urlunsplit((parts.scheme, parts.netloc.lower(), parts.path, urlencode(query), ''))
+
+    if isinstance(body, bytes):
+        body = body.decode('utf-8', errors='replace')
+    body = body or ''
+    try:
+        data = json.loads(body)
+        if isinstance(data, dict):
+            data = {k: v for k, v in data.items() if k not in ignored_fields}
+        body = json.dumps(data, sort_keys=True, separators=(',', ':'))
+    except ValueError:
+        if '=' in body:
+            body = urlencode(sorted((k, v) for k, v in parse_qsl(body, keep_blank_values=True) if k not in ignored_fields))
+
+    return f"{method.upper()} {normalized_url} {body}"
+
+
+class Cassette:
+    """
+    Records the HTTP traffic of spotipy, openai, requests (ElevenLabs), googleapiclient (Blogger)
+    and the async wrappers (aiohttp), or replays it from disk.
+
+    The cassette is stored as two files: `<path>` holds the zlib-compressed responses and
+    `<path>.idx` a sorted index of fixed-size entries, which is memory-mapped and binary-searched
+    on replay. Identical requests are numbered, so the n-th call replays the n-th recorded response.
+
+    Attributes:
+        path (str): The cassette data file.
+        mode (str): 'record' or 'replay'.
+        latency (float): Artificial latency in seconds added to every replayed response.
+        ignored_fields (tuple): Query or body fields left out of the request key.
+    """
+
+    def __init__(self, path: str, mode: str = 'replay', latency: float = 0.0, ignored_fields=DEFAULT_IGNORED_FIELDS):
+        """
+        Initializes the cassette. In replay mode the data file and the index are memory-mapped.
+
+        Args:
+            path (str): The cassette data file.
+            mode (str): 'record' or 'replay'.
+            latency (float): Artificial latency in seconds added to every replayed response.
+            ignored_fields (tuple): Query or body fields left out of the request key.
+
+        Raises:
+            ValueError: If the mode is not 'record' or 'replay'.
+            FileNotFoundError: If the cassette does not exist in replay mode.
+        """
+        if mode not in ('record', 'replay'):
+            raise ValueError(f"Invalid cassette mode: {mode}")
+
+        self.path = path
+        self.mode = mode
+        self.latency = latency
+        self.ignored_fields = ignored_fields
+        self._lock = threading.Lock()
+        self._occurrences = {}
+        self._recorded = []
+        self._files = []
+        self._data = None
+        self._index = None
+
+        if mode == 'replay':
+            self._data = self._map(path)
+            self._index = self._map(f"{path}.idx")
+            logger.info(f"Replaying {len(self._index) // _INDEX_ENTRY.size} responses from cassette {path}")
+
+    def _map(self, path: str):
+        """Memory-maps a cassette file for reading."""
+        cassette_file = open(path, 'rb')
+        self._files.append(cassette_file)
+        if os.fstat(cassette_file.fileno()).st_size == 0:
+            return b''
+        return mmap.mmap(cassette_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _next_occurrence(self, method: str, url: str, body) -> tuple:
+        """Returns the normalized request and how many times it was seen before."""
+        normalized = normalize_request(method, url, body, self.ignored_fields)
+        with self._lock:
+            occurrence = self._occurrences.get(normalized, 0)
+            self._occurrences[normalized] = occurrence + 1
+        return normalized, occurrence
+
+    @staticmethod
+    def _digest(normalized: str, occurrence: int) -> bytes:
+        return hashlib.sha256(f"{normalized}#{occurrence}".encode('utf-8')).digest()
+
+    def _lookup(self, digest: bytes):
+        """Binary-searches the memory-mapped index. Returns the record, or None if not found."""
+        low, high = 0, len(self._index) // _INDEX_ENTRY.size
+        while low < high:
+            middle = (low + high) // 2
+            key, offset, length = _INDEX_ENTRY.unpack_from(self._index, middle * _INDEX_ENTRY.size)
+            if key == digest:
+                return json.loads(zlib.decompress(self._data[offset:offset + length]))
+            if key < digest:
+                low = middle + 1
+            else:
+                high = middle
+        return None
+
+    def play(self, method: str, url: str, body) -> dict:
+        """
+        Returns the recorded response of a request. When a request was made more often than it
+        was recorded, the last recorded response is repeated.
+
+        Args:
+            method (str): The HTTP method.
+            url (str): The request URL.
+            body (bytes | str): The request body, if any.
+
+        Returns:
+            dict: The recorded response, with 'status', 'headers' and 'body' (bytes).
+
+        Raises:
+            CassetteMissError: If the request was never recorded.
+        """
+        record = self._find(method, url, body)
+        if self.latency:
+            time.sleep(self.latency)
+        return record
+
+    async def aplay(self, method: str, url: str, body) -> dict:
+        """Async version of `play`, waiting for the latency without blocking the event loop."""
+        record = self._find(method, url, body)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return record
+
+    def _find(self, method: str, url: str, body) -> dict:
+        """Returns the recorded response of a request, without latency."""
+        normalized, occurrence = self._next_occurrence(method, url, body)
+        for n in range(occurrence, -1, -1):
+            record = self._lookup(self._digest(normalized, n))
+            if record is not None:
+                break
+        else:
+            logger.error(f"No recorded response for {method} {url}")
+            raise CassetteMissError(f"No recorded response in {self.path} for: {normalized}")
+
+        record['body'] = base64.b64decode(record['body'])
+        return record
+
+    def record(self, method: str, url: str, body, status: int, headers: dict, content: bytes):
+        """
+        Adds a response to the cassette. Recorded responses are written by `save`, with their OAuth
+        tokens scrubbed.
+
+        Args:
+            method (str): The HTTP method.
+            url (str): The request URL.
+            body (bytes | str): The request body, if any.
+            status (int): The response status code.
+            headers (dict): The response headers.
+            content (bytes): The decoded response body.
+        """
+        normalized, occurrence = self._next_occurrence(method, url, body)
+        record = {
+            'status': status,
+            'headers': {k: v for k, v in headers.items() if k.lower() not in _DROPPED_HEADERS},
+            'body': base64.b64encode(_scrub_tokens(content or b'')).decode('ascii'),
+        }
+        compressed = zlib.compress(json.dumps(record).encode('utf-8'))
+        with self._lock:
+            self._recorded.append((self._digest(normalized, occurrence), compressed))
+
+    def save(self):
+        """
+        Writes the recorded responses and the sorted index to disk.
+
+        Raises:
+            OSError: If writing the files fails.
+        """
+        try:
+            offset = 0
+            with open(f"{self.path}.tmp", 'wb') as data_file, open(f"{self.path}.idx.tmp", 'wb') as index_file:
+                for digest, compressed in sorted(self._recorded):
+                    data_file.write(compressed)
+                    index_file.write(_INDEX_ENTRY.pack(digest, offset, len(compressed)))
+                    offset += len(compressed)
+            os.replace(f"{self.path}.tmp", self.path)
+            os.replace(f"{self.path}.idx.tmp", f"{self.path}.idx")
+            logger.info(f"Recorded {len(self._recorded)} responses to cassette {self.path}")
+        except OSError as e:
+            logger.error(f"Error saving cassette {self.path}: {e}")
+            raise
+
+    def close(self):
+        """Releases the memory-mapped files."""
+        for mapped in (self._data, self._index):
+            if isinstance(mapped, mmap.mmap):
+                mapped.close()
+        for cassette_file in self._files:
+            cassette_file.close()
+        self._files = []
+
+    def adapter_send(self, adapter, request, **kwargs):
+        """Replacement for `requests.adapters.HTTPAdapter.send`."""
+        if self.mode == 'record':
+            response = _original_adapter_send(adapter, request, **kwargs)
+            self.record(request.method, request.url, request.body, response.status_code,
+                        response.headers, response.content)
+            return response
+
+        record = self.play(request.method, request.url, request.body)
+        response = requests.Response()
+        response.status_code = record['status']
+        response.headers = CaseInsensitiveDict(record['headers'])
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.raw = io.BytesIO(record['body'])
+        response._content = record['body']
+        response.url = request.url
+        response.request = request
+        response.reason = http.client.responses.get(response.status_code, '')
+        return response
+
+    def http_request(self, http, uri, method='GET', body=None, headers=None, *args, **kwargs):
+        """Replacement for `httplib2.Http.request`."""
+        if self.mode == 'record':
+            response, content = _original_http_request(http, uri, method, body, headers, *args, **kwargs)
+            self.record(method, uri, body, response.status, dict(response), content)
+            return response, content
+
+        record = self.play(method, uri, body)
+        response = httplib2.Response(dict(record['headers'], status=str(record['status'])))
+        return response, record['body']
+
+    async def session_request(self, session, method, url, **kwargs):
+        """
+        Replacement for `aiohttp.ClientSession._request`. In both modes the response is returned
+        from its stored body, since recording reads the body to its end.
+        """
+        raise_for_status = kwargs.pop('raise_for_status', None)
+        params = kwargs.get('params')
+        request_url = str(URL(str(url)).update_query(params) if params else url)
+        body = kwargs.get('data') if kwargs.get('json') is None else json.dumps(kwargs['json'])
+        if self.mode == 'record':
+            response = await _original_session_request(session, method, url, **kwargs)
+            async with response:
+                content = await response.read()
+            self.record(method, request_url, body, response.status, dict(response.headers), content)
+            record = {'status': response.status, 'headers': dict(response.headers), 'body': content}
+        else:
+            record = await self.aplay(method, request_url, body)
+
+        response = _CassetteResponse(method, request_url, record)
+        if raise_for_status is True:
+            response.raise_for_status()
+        return response
+
+
+class _CassetteStream:
+    """The body of a cassette aiohttp response, read at once or line by line (streamed responses)."""
+
+    def __init__(self, body: bytes):
+        self._body = io.BytesIO(body)
+
+    async def read(self, n: int = -1) -> bytes:
+        return self._body.read(n)
+
+    async def readline(self) -> bytes:
+        return self._body.readline()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> bytes:
+        line = self._body.readline()
+        if not line:
+            raise StopAsyncIteration
+        return line
+
+
+class _CassetteResponse:
+    """
+    The subset of `aiohttp.ClientResponse` used by the async API wrappers and openai, built from a
+    recorded response.
+    """
+
+    def __init__(self, method: str, url: str, record: dict):
+        self.method = method
+        self.url = URL(url)
+        self.status = record['status']
+        self.reason = http.client.responses.get(self.status, '')
+        self.headers = CIMultiDictProxy(CIMultiDict(record['headers']))
+        self.content_length = len(record['body'])
+        self.content = _CassetteStream(record['body'])
+        self._body = record['body']
+
+    @property
+    def ok(self) -> bool:
+        return self.status < 400
+
+    async def read(self) -> bytes:
+        return self._body
+
+    async def text(self, encoding: str = None) -> str:
+        return self._body.decode(encoding or 'utf-8', errors='replace')
+
+    async def json(self, content_type=None, loads=json.loads):
+        return loads(await self.text()) if self._body else None
+
+    def raise_for_status(self):
+        if self.status >= 400:
+            request_info = aiohttp.RequestInfo(self.url, self.method, CIMultiDictProxy(CIMultiDict()), self.url)
+            raise aiohttp.ClientResponseError(request_info, (), status=self.status, message=self.reason,
+                                              headers=self.headers)
+
+    def release(self):
+        pass
+
+    def close(self):
+        pass
+
+    async def wait_for_close(self):
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+
+@contextlib.contextmanager
+def use_cassette(path: str, mode: str = 'replay', latency: float = 0.0, ignored_fields=DEFAULT_IGNORED_FIELDS):
+    """
+    Records or replays all the HTTP traffic made inside the block.
+
+    Args:
+        path (str): The cassette data file.
+        mode (str): 'record' or 'replay'.
+        latency (float): Artificial latency in seconds added to every replayed response.
+        ignored_fields (tuple): Query or body fields left out of the request key.
+
+    Yields:
+        Cassette: The active cassette.
+    """
+    global _active
+    cassette = Cassette(path, mode=mode, latency=latency, ignored_fields=ignored_fields)
+
+    def adapter_send(adapter, request, **kwargs):
+        return cassette.adapter_send(adapter, request, **kwargs)
+
+    def http_request(http, uri, *args, **kwargs):
+        return cassette.http_request(http, uri, *args, **kwargs)
+
+    async def session_request(session, method, url, **kwargs):
+        return await cassette.session_request(session, method, url, **kwargs)
+
+    previous_send, previous_request = HTTPAdapter.send, httplib2.Http.request
+    previous_session_request = aiohttp.ClientSession._request
+    previous_active = _active
+    _active = cassette
+    HTTPAdapter.send = adapter_send
+    httplib2.Http.request = http_request
+    aiohttp.ClientSession._request = session_request
+    try:
+        yield cassette
+    finally:
+        HTTPAdapter.send = previous_send
+        httplib2.Http.request = previous_request
+        aiohttp.ClientSession._request = previous_session_request
+        _active = previous_active
+        if mode == 'record':
+            cassette.save()
+        cassette.close()
+
+
+def cassette_from_env():
+    """
+    Returns a `use_cassette` block configured from the environment, or a no-op block.
+
+    Environment variables:
+        CASSETTE_MODE: 'record' or 'replay'. Unset disables the cassette.
+        CASSETTE_PATH: The cassette data file. Default is 'weekly_run.cassette'.
+        CASSETTE_LATENCY: Artificial latency in seconds added to every replayed response.
+
+    Returns:
+        contextlib.AbstractContextManager: The cassette block.
+    """
+    mode = os.getenv('CASSETTE_MODE')
+    if not mode:
+        return contextlib.nullcontext()
+    path = os.getenv('CASSETTE_PATH', 'weekly_run.cassette')
+    latency = float(os.getenv('CASSETTE_LATENCY', '0'))
+    logger.info(f"Cassette mode '{mode}' using {path}")
+    return use_cassette(path, mode=mode, latency=latency)
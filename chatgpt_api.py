@@ -3,7 +3,15 @@ import openai
 import logging
 from logging_config import setup_logging
 from dotenv import load_dotenv
+import asyncio
+import queue
 import random
+import threading
+import time
+
+from async_http import hold_session
+from cassette import CassetteMissError
+from profiling import in_current_stage
 
 # Load environment variables
 load_dotenv()
@@ -21,53 +29,327 @@ if not openai.api_key:
 DEFAULT_MODEL = "gpt-4o-mini"
 MAX_TOKENS = 60
 
-def get_openai_response(user_message, model=DEFAULT_MODEL, temperature=None):
+# Deadline for a whole request, in seconds. Also used as the HTTP timeout.
+DEFAULT_TIMEOUT = 30
+# Seconds without a complete response before a hedged duplicate request is sent.
+HEDGE_AFTER = 5
+# How often the consumer wakes up to check for cancellation, in seconds.
+POLL_INTERVAL = 0.1
+
+
+class ResponseMetrics:
     """
-    Send a user message to the OpenAI API and retrieve the model's response.
+    Latency metrics recorded for a single OpenAI request.
 
-    Args:
-        user_message (str): The input message from the user.
-        model (str): The OpenAI model to use.
-        temperature (float): Temperature to adjust creativity.
+    Attributes:
+        time_to_first_token (float): Seconds until the first token arrived, or None if none did.
+        total_latency (float): Seconds until the stream finished, failed or was cancelled.
+        hedged (bool): Whether a hedged duplicate request was sent because the original had not finished in time.
+        winning_attempt (int): The attempt that produced the response (0 = original, 1 = hedge).
+    """
+
+    def __init__(self):
+        self.time_to_first_token = None
+        self.total_latency = None
+        self.hedged = False
+        self.winning_attempt = None
+
+    def __str__(self):
+        return (f"time to first token: {self.time_to_first_token}, total latency: {self.total_latency}, "
+                f"hedged: {self.hedged}, winning attempt: {self.winning_attempt}")
+
+
+def _request_params(user_message, model, temperature, timeout):
+    """
+    Builds the parameters of a chat completion request, picking a random temperature if none is given.
 
     Returns:
-        str: The model's response or error message.
+        dict: Parameters for `openai.ChatCompletion.create` / `acreate`.
     """
     temperature = temperature if temperature is not None else random.random()
 
-    try:
-        # Log the model and message
-        logger.info(f"Requesting model '{model}' with message: {user_message}")
-        logger.info(f"Using temperature: {temperature}")
-
-        # OpenAI API call
-        response = openai.ChatCompletion.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant."},
-                {"role": "user", "content": user_message},
-            ],
-            max_tokens=MAX_TOKENS,
-            temperature=temperature,
-        )
-
-        return response['choices'][0]['message']['content']
-    
-    except openai.error.InvalidRequestError as e:
+    # Log the model and message
+    logger.info(f"Requesting model '{model}' with message: {user_message}")
+    logger.info(f"Using temperature: {temperature}")
+
+    return {
+        'model': model,
+        'messages': [
+            {"role": "system", "content": "You are a helpful assistant."},
+            {"role": "user", "content": user_message},
+        ],
+        'max_tokens': MAX_TOKENS,
+        'temperature': temperature,
+        'request_timeout': timeout,
+    }
+
+
+def _error_response(e):
+    """
+    Logs an error of an OpenAI request and returns the message returned in place of the response.
+    A request missing from a replayed cassette is raised instead, so the replay fails.
+
+    Args:
+        e (Exception): The error.
+
+    Returns:
+        str: The error message.
+
+    Raises:
+        CassetteMissError: If the error is a cassette miss.
+    """
+    if isinstance(e, CassetteMissError):
+        raise e
+
+    if isinstance(e, openai.error.InvalidRequestError):
         logger.error(f"Invalid request: {e}")
         return f"Error: Invalid request - {e}"
-    
-    except openai.error.AuthenticationError as e:
+
+    if isinstance(e, openai.error.AuthenticationError):
         logger.error(f"Authentication error: {e}")
         return f"Error: Authentication failed - check your API key."
 
-    except openai.error.RateLimitError as e:
+    if isinstance(e, openai.error.RateLimitError):
         logger.warning(f"Rate limit exceeded: {e}")
         return "Error: Rate limit exceeded, please try again later."
-    
+
+    if isinstance(e, (TimeoutError, asyncio.TimeoutError)):
+        logger.error(f"Request timed out: {e}")
+        return f"Error: Request timed out - {e}"
+
+    logger.error("An unexpected error occurred.", exc_info=e)
+    return f"Error: An unexpected error occurred - {e}"
+
+
+def _stream_attempt(attempt, request_params, events, cancelled):
+    """
+    Runs one streaming request in a worker thread and forwards its events to the consumer.
+
+    Args:
+        attempt (int): The attempt number, used to tag the events.
+        request_params (dict): Parameters for `openai.ChatCompletion.create`.
+        events (queue.Queue): Queue receiving `(attempt, kind, payload)` tuples.
+        cancelled (threading.Event): Set by the consumer when this attempt is no longer needed.
+    """
+    try:
+        response = openai.ChatCompletion.create(stream=True, **request_params)
+        for chunk in response:
+            if cancelled.is_set():
+                return
+            token = chunk['choices'][0]['delta'].get('content')
+            if token:
+                events.put((attempt, 'token', token))
+        events.put((attempt, 'done', None))
+    except Exception as e:
+        events.put((attempt, 'error', e))
+
+
+def stream_openai_response(user_message, model=DEFAULT_MODEL, temperature=None, timeout=DEFAULT_TIMEOUT,
+                           hedge_after=HEDGE_AFTER, cancel_event=None, metrics=None):
+    """
+    Send a user message to the OpenAI API and yield the response tokens.
+
+    If the response has not finished after `hedge_after` seconds, a duplicate request is sent and
+    the tokens of whichever attempt finishes first are yielded; the other one is cancelled. As the
+    winner is only known once it finishes, the tokens are held back until then when hedging is
+    enabled, and yielded as they arrive when it is disabled.
+
+    Args:
+        user_message (str): The input message from the user.
+        model (str): The OpenAI model to use.
+        temperature (float): Temperature to adjust creativity.
+        timeout (float): Deadline in seconds for the whole request.
+        hedge_after (float): Seconds to wait for a complete response before hedging. None disables hedging.
+        cancel_event (threading.Event): Optional event that stops the stream when set.
+        metrics (ResponseMetrics): Optional object filled with the latency metrics of the call.
+
+    Yields:
+        str: The response tokens.
+
+    Raises:
+        TimeoutError: If the response is not complete within `timeout` seconds.
+        openai.error.OpenAIError: If the request fails.
+    """
+    metrics = metrics if metrics is not None else ResponseMetrics()
+    request_params = _request_params(user_message, model, temperature, timeout)
+    events = queue.Queue()
+    attempts = []  # One cancellation event per attempt
+    tokens = []  # The tokens received from each attempt
+    first_token_times = []  # Seconds until the first token of each attempt
+    failed = set()
+    start = time.monotonic()
+    deadline = start + timeout
+
+    def launch():
+        cancelled = threading.Event()
+        attempts.append(cancelled)
+        tokens.append([])
+        first_token_times.append(None)
+        threading.Thread(target=in_current_stage(_stream_attempt),
+                         args=(len(attempts) - 1, request_params, events, cancelled), daemon=True).start()
+
+    launch()
+    try:
+        while True:
+            if cancel_event is not None and cancel_event.is_set():
+                logger.warning("OpenAI request cancelled.")
+                return
+
+            now = time.monotonic()
+            if now >= deadline:
+                raise TimeoutError(f"OpenAI request did not complete within {timeout} seconds.")
+
+            wait = min(deadline - now, POLL_INTERVAL)
+            if hedge_after is not None and len(attempts) == 1:
+                if now - start >= hedge_after:
+                    logger.warning(f"No response after {hedge_after} seconds, sending a hedged request.")
+                    metrics.hedged = True
+                    launch()
+                    continue
+                wait = min(wait, start + hedge_after - now)
+
+            try:
+                attempt, kind, payload = events.get(timeout=wait)
+            except queue.Empty:
+                continue
+
+            if kind == 'error':
+                failed.add(attempt)
+                if len(failed) == len(attempts):
+                    raise payload
+                logger.warning(f"OpenAI attempt {attempt} failed, waiting for the other attempt: {payload}")
+                continue
+
+            if kind == 'token':
+                if first_token_times[attempt] is None:
+                    first_token_times[attempt] = time.monotonic() - start
+                if hedge_after is None:
+                    # Without hedging there is a single attempt, which is streamed as it arrives
+                    metrics.time_to_first_token = first_token_times[attempt]
+                    yield payload
+                else:
+                    tokens[attempt].append(payload)
+                continue
+
+            # The first attempt to finish wins
+            metrics.winning_attempt = attempt
+            metrics.time_to_first_token = first_token_times[attempt]
+            for cancelled in attempts:
+                cancelled.set()
+            yield from tokens[attempt]
+            return
+    finally:
+        for cancelled in attempts:
+            cancelled.set()
+        metrics.total_latency = time.monotonic() - start
+        logger.info(f"OpenAI request metrics: {metrics}")
+
+
+def get_openai_response(user_message, model=DEFAULT_MODEL, temperature=None, timeout=DEFAULT_TIMEOUT,
+                        hedge_after=HEDGE_AFTER, metrics=None):
+    """
+    Send a user message to the OpenAI API and retrieve the model's response.
+
+    Args:
+        user_message (str): The input message from the user.
+        model (str): The OpenAI model to use.
+        temperature (float): Temperature to adjust creativity.
+        timeout (float): Deadline in seconds for the whole request.
+        hedge_after (float): Seconds to wait for a complete response before hedging. None disables hedging.
+        metrics (ResponseMetrics): Optional object filled with the latency metrics of the call.
+
+    Returns:
+        str: The model's response or error message.
+    """
+    try:
+        return "".join(stream_openai_response(user_message, model=model, temperature=temperature,
+                                              timeout=timeout, hedge_after=hedge_after, metrics=metrics))
+    except Exception as e:
+        return _error_response(e)
+
+
+async def _aattempt(request_params, start):
+    """
+    Runs one streaming request on the event loop.
+
+    Returns:
+        tuple: The response text and the seconds until its first token (None if it had none).
+    """
+    response = await openai.ChatCompletion.acreate(stream=True, **request_params)
+    tokens = []
+    time_to_first_token = None
+    async for chunk in response:
+        token = chunk['choices'][0]['delta'].get('content')
+        if token:
+            if time_to_first_token is None:
+                time_to_first_token = time.monotonic() - start
+            tokens.append(token)
+    return "".join(tokens), time_to_first_token
+
+
+async def _ahedged(request_params, hedge_after, metrics):
+    """
+    Runs a request, sending a hedged duplicate if it has not finished after `hedge_after` seconds,
+    and returns the response of whichever attempt finishes first.
+    """
+    start = time.monotonic()
+    attempts = [asyncio.ensure_future(_aattempt(request_params, start))]
+    pending = set(attempts)
+    try:
+        if hedge_after is not None:
+            done, _ = await asyncio.wait(pending, timeout=hedge_after)
+            if not done:
+                logger.warning(f"No response after {hedge_after} seconds, sending a hedged request.")
+                metrics.hedged = True
+                attempts.append(asyncio.ensure_future(_aattempt(request_params, start)))
+                pending.add(attempts[-1])
+
+        while True:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    text, metrics.time_to_first_token = task.result()
+                    metrics.winning_attempt = attempts.index(task)
+                    return text
+            if not pending:
+                raise done.pop().exception()
+            logger.warning("OpenAI attempt failed, waiting for the other attempt.")
+    finally:
+        for task in attempts:
+            task.cancel()
+        metrics.total_latency = time.monotonic() - start
+        logger.info(f"OpenAI request metrics: {metrics}")
+
+
+async def aget_openai_response(user_message, model=DEFAULT_MODEL, temperature=None, timeout=DEFAULT_TIMEOUT,
+                               hedge_after=HEDGE_AFTER, metrics=None):
+    """
+    Async version of `get_openai_response`, using the shared async HTTP session.
+
+    If the response has not finished after `hedge_after` seconds, a duplicate request is sent and
+    the response of whichever attempt finishes first is returned.
+
+    Args:
+        user_message (str): The input message from the user.
+        model (str): The OpenAI model to use.
+        temperature (float): Temperature to adjust creativity.
+        timeout (float): Deadline in seconds for the whole request.
+        hedge_after (float): Seconds to wait before hedging. None disables hedging.
+        metrics (ResponseMetrics): Optional object filled with the latency metrics of the call.
+
+    Returns:
+        str: The model's response or error message.
+    """
+    metrics = metrics if metrics is not None else ResponseMetrics()
+    try:
+        request_params = _request_params(user_message, model, temperature, timeout)
+        # Share the pooled connections with the other async wrappers
+        async with hold_session():
+            return await asyncio.wait_for(_ahedged(request_params, hedge_after, metrics), timeout)
+    except asyncio.TimeoutError:
+        return _error_response(TimeoutError(f"OpenAI request did not complete within {timeout} seconds."))
     except Exception as e:
-        logger.exception("An unexpected error occurred.")
-        return f"Error: An unexpected error occurred - {e}"
+        return _error_response(e)
 
 def main(user_message):
     """
@@ -1,6 +1,9 @@
 import requests
 import os
+import asyncio
 import logging
+import aiohttp
+from async_http import hold_session
 from logging_config import setup_logging
 from dotenv import load_dotenv
 from requests.exceptions import HTTPError, RequestException
@@ -13,19 +16,12 @@ setup_logging()
 logger = logging.getLogger(__name__)
 
 
-def text_to_speech(text: str, voice_id: str, output_filename: str = "output.mp3", stability: float = 0.75, similarity_boost: float = 0.75):
+def _build_request(text: str, voice_id: str, stability: float, similarity_boost: float) -> tuple:
     """
-    Converts text to speech using the ElevenLabs API with customizable voice settings and saves the result as an MP3 file.
-
-    :param text: The text to convert to speech.
-    :param voice_id: The ID of the voice to use from ElevenLabs.
-    :param output_filename: The filename for the output mp3 file. Default is "output.mp3".
-    :param stability: Controls the stability of the generated speech. Higher values = more stability (default: 0.75).
-    :param similarity_boost: Boosts similarity to the target voice. Higher values = closer similarity (default: 0.75).
+    Validates the inputs and builds the URL, headers and payload of a text-to-speech request.
 
-    :raises ValueError: If text or voice_id is empty or invalid.
-    :raises HTTPError: For HTTP issues like a failed API request.
-    :raises IOError: If writing the file to disk fails.
+    :raises ValueError: If the API key, text or voice_id is missing.
+    :return: A tuple with the URL, headers and JSON payload.
     """
     # Get API key from environment variable
     api_key = os.getenv("ELEVENLABS_API_KEY")
@@ -55,6 +51,25 @@ def text_to_speech(text: str, voice_id: str, output_filename: str = "output.mp3"
         }
     }
 
+    return url, headers, data
+
+
+def text_to_speech(text: str, voice_id: str, output_filename: str = "output.mp3", stability: float = 0.75, similarity_boost: float = 0.75):
+    """
+    Converts text to speech using the ElevenLabs API with customizable voice settings and saves the result as an MP3 file.
+
+    :param text: The text to convert to speech.
+    :param voice_id: The ID of the voice to use from ElevenLabs.
+    :param output_filename: The filename for the output mp3 file. Default is "output.mp3".
+    :param stability: Controls the stability of the generated speech. Higher values = more stability (default: 0.75).
+    :param similarity_boost: Boosts similarity to the target voice. Higher values = closer similarity (default: 0.75).
+
+    :raises ValueError: If text or voice_id is empty or invalid.
+    :raises HTTPError: For HTTP issues like a failed API request.
+    :raises IOError: If writing the file to disk fails.
+    """
+    url, headers, data = _build_request(text, voice_id, stability, similarity_boost)
+
     try:
         # Send POST request to the API
         logger.info(f"Sending request to ElevenLabs API with voice_id={voice_id}, stability={stability}, similarity_boost={similarity_boost}.")
@@ -64,8 +79,7 @@ def text_to_speech(text: str, voice_id: str, output_filename: str = "output.mp3"
         response.raise_for_status()
 
         # Write the response content (audio) as an mp3 file
-        with open(output_filename, "wb") as file:
-            file.write(response.content)
+        _write_file(output_filename, response.content)
 
         logger.info(f"MP3 file saved successfully as {output_filename}")
 
@@ -83,6 +97,52 @@ def text_to_speech(text: str, voice_id: str, output_filename: str = "output.mp3"
         raise
 
 
+async def atext_to_speech(text: str, voice_id: str, output_filename: str = "output.mp3", stability: float = 0.75, similarity_boost: float = 0.75):
+    """
+    Async version of `text_to_speech`, using the shared async HTTP session.
+
+    :param text: The text to convert to speech.
+    :param voice_id: The ID of the voice to use from ElevenLabs.
+    :param output_filename: The filename for the output mp3 file. Default is "output.mp3".
+    :param stability: Controls the stability of the generated speech. Higher values = more stability (default: 0.75).
+    :param similarity_boost: Boosts similarity to the target voice. Higher values = closer similarity (default: 0.75).
+
+    :raises ValueError: If text or voice_id is empty or invalid.
+    :raises aiohttp.ClientResponseError: For HTTP issues like a failed API request.
+    :raises IOError: If writing the file to disk fails.
+    """
+    url, headers, data = _build_request(text, voice_id, stability, similarity_boost)
+
+    try:
+        logger.info(f"Sending request to ElevenLabs API with voice_id={voice_id}, stability={stability}, similarity_boost={similarity_boost}.")
+        async with hold_session() as session, \
+                session.post(url, headers=headers, json=data, raise_for_status=True) as response:
+            content = await response.read()
+
+        # Write the file off the event loop
+        await asyncio.to_thread(_write_file, output_filename, content)
+
+        logger.info(f"MP3 file saved successfully as {output_filename}")
+
+    except aiohttp.ClientResponseError as http_err:
+        logger.error(f"HTTP error occurred: {http_err}")
+        raise
+    except aiohttp.ClientError as req_err:
+        logger.error(f"Request error occurred: {req_err}")
+        raise
+    except IOError as io_err:
+        logger.error(f"File I/O error occurred: {io_err}")
+        raise
+    except Exception as err:
+        logger.error(f"An unexpected error occurred: {err}")
+        raise
+
+
+def _write_file(output_filename: str, content: bytes):
+    with open(output_filename, "wb") as file:
+        file.write(content)
+
+
 # Example usage
 if __name__ == "__main__":
     try:
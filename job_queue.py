@@ -0,0 +1,370 @@
+import time
+import sqlite3
+import logging
+import threading
+from logging_config import setup_logging
+from profiling import in_current_stage
+
+setup_logging()  # Ensure the logger is set up
+logger = logging.getLogger(__name__)
+
+# SQLite file holding the queue
+QUEUE_FILE = 'jobs.sqlite3'
+# Seconds a leased job stays invisible to other workers before it can be leased again
+LEASE_SECONDS = 900
+# Attempts before a job is marked as failed
+MAX_ATTEMPTS = 3
+# Seconds before the first retry of a failed job, doubled on every further attempt
+RETRY_DELAY = 60
+# Seconds an idle worker waits before polling the queue again
+POLL_INTERVAL = 1.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    blog_id TEXT NOT NULL,
+    genre TEXT NOT NULL,
+    year INTEGER NOT NULL,
+    week INTEGER NOT NULL,
+    voice_id TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    available_at REAL NOT NULL,
+    lease_owner TEXT,
+    lease_expires_at REAL,
+    enqueued_at REAL NOT NULL,
+    finished_at REAL,
+    last_error TEXT,
+    UNIQUE (blog_id, genre, year, week)
+);
+CREATE INDEX IF NOT EXISTS jobs_status_available ON jobs (status, available_at);
+"""
+
+# Condition of the updates made by the worker holding a lease: a worker whose lease expired
+# and whose job was leased again must not overwrite the result of the new lease
+_LEASE_HELD = " AND status = 'leased' AND lease_owner = ? AND attempts = ?"
+
+
+class Job:
+    """
+    A weekly publishing job.
+
+    Attributes:
+        id (int): The job ID.
+        blog_id (str): The Blogger blog to publish to.
+        genre (str): The genre of the chart.
+        year (int): The ISO year.
+        week (int): The ISO week number.
+        voice_id (str): The ElevenLabs voice of the audio file.
+        attempts (int): Number of times the job was leased, including the current one.
+        lease_owner (str): The worker holding the lease.
+    """
+
+    def __init__(self, job_id, blog_id, genre, year, week, voice_id, attempts, lease_owner=None):
+        self.id = job_id
+        self.blog_id = blog_id
+        self.genre = genre
+        self.year = year
+        self.week = week
+        self.voice_id = voice_id
+        self.attempts = attempts
+        self.lease_owner = lease_owner
+
+    def __str__(self):
+        return f"Job {self.id} (blog: {self.blog_id}, genre: {self.genre}, week: {self.year}-W{self.week:02d}, attempt: {self.attempts})"
+
+
+class JobQueue:
+    """
+    Persistent job queue backed by SQLite, with leases and retries.
+
+    A worker leases a job for `lease_seconds`; if it neither completes nor fails the job in time
+    (e.g. the process died), the job can be leased again. Failed jobs are retried with an
+    exponential delay until `max_attempts` is reached.
+
+    Attributes:
+        path (str): The SQLite file.
+    """
+
+    def __init__(self, path: str = QUEUE_FILE):
+        """
+        Opens the queue, creating it if it does not exist.
+
+        Args:
+            path (str): The SQLite file.
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(_SCHEMA)
+        logger.info(f"Job queue opened at {path}")
+
+    def close(self):
+        """Closes the database connection."""
+        with self._lock:
+            self._db.close()
+
+    def enqueue(self, blog_id, genre, year, week, voice_id, max_attempts=MAX_ATTEMPTS, rerun_done=False) -> bool:
+        """
+        Adds a job to the queue. There is one job per blog, genre and week: a failed job (or, with
+        `rerun_done`, a done job) is queued again with its attempts reset, while a queued or leased
+        job is left as it is.
+
+        Args:
+            blog_id (str): The Blogger blog to publish to.
+            genre (str): The genre of the chart.
+            year (int): The ISO year.
+            week (int): The ISO week number.
+            voice_id (str): The ElevenLabs voice of the audio file.
+            max_attempts (int): Attempts before the job is marked as failed.
+            rerun_done (bool): Whether to queue the job again if it is already done.
+
+        Returns:
+            bool: True if the job was queued, False if it was left as it is.
+        """
+        now = time.time()
+        week_name = f"blog {blog_id}, genre {genre}, week {year}-W{int(week):02d}"
+        requeued_statuses = ('failed', 'done') if rerun_done else ('failed',)
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute(
+                    "SELECT status FROM jobs WHERE blog_id = ? AND genre = ? AND year = ? AND week = ?",
+                    (blog_id, genre, int(year), int(week))).fetchone()
+                if row is None:
+                    self._db.execute(
+                        "INSERT INTO jobs (blog_id, genre, year, week, voice_id, max_attempts, available_at, enqueued_at) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        (blog_id, genre, int(year), int(week), voice_id, max_attempts, now, now))
+                elif row[0] in requeued_statuses:
+                    self._db.execute(
+                        "UPDATE jobs SET status = 'queued', voice_id = ?, attempts = 0, max_attempts = ?, "
+                        "available_at = ?, enqueued_at = ?, finished_at = NULL, last_error = NULL "
+                        "WHERE blog_id = ? AND genre = ? AND year = ? AND week = ?",
+                        (voice_id, max_attempts, now, now, blog_id, genre, int(year), int(week)))
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+
+        if row is None:
+            logger.info(f"Queued job for {week_name}.")
+        elif row[0] in requeued_statuses:
+            logger.info(f"Queued the {row[0]} job for {week_name} again.")
+        else:
+            hint = " Set rerun_done to queue it again." if row[0] == 'done' else ""
+            logger.warning(f"Job for {week_name} is already {row[0]}, not queued again.{hint}")
+            return False
+        return True
+
+    def lease(self, worker_id: str, lease_seconds: float = LEASE_SECONDS):
+        """
+        Leases the next available job: a queued job whose retry delay has passed, or a job whose lease expired.
+
+        Args:
+            worker_id (str): The worker taking the job.
+            lease_seconds (float): Seconds before the lease expires.
+
+        Returns:
+            Job: The leased job, or None if no job is available.
+        """
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                # Jobs whose last lease expired on their last attempt are not retried
+                self._db.execute(
+                    "UPDATE jobs SET status = 'failed', finished_at = ?, last_error = 'Lease expired' "
+                    "WHERE status = 'leased' AND lease_expires_at <= ? AND attempts >= max_attempts",
+                    (now, now))
+                row = self._db.execute(
+                    "SELECT id FROM jobs WHERE (status = 'queued' AND available_at <= ?) "
+                    "OR (status = 'leased' AND lease_expires_at <= ?) ORDER BY available_at LIMIT 1",
+                    (now, now)).fetchone()
+                if row is None:
+                    self._db.execute("COMMIT")
+                    return None
+                self._db.execute(
+                    "UPDATE jobs SET status = 'leased', lease_owner = ?, lease_expires_at = ?, attempts = attempts + 1 "
+                    "WHERE id = ?",
+                    (worker_id, now + lease_seconds, row[0]))
+                job = self._db.execute(
+                    "SELECT id, blog_id, genre, year, week, voice_id, attempts, lease_owner FROM jobs WHERE id = ?",
+                    (row[0],)).fetchone()
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        return Job(*job)
+
+    def complete(self, job: Job) -> bool:
+        """
+        Marks a job as done, unless its lease was lost (it expired and the job was leased again).
+
+        Args:
+            job (Job): The leased job.
+
+        Returns:
+            bool: True if the job was marked as done, False if the lease was lost and the result dropped.
+        """
+        with self._lock:
+            cursor = self._db.execute(
+                "UPDATE jobs SET status = 'done', finished_at = ?, lease_owner = NULL, lease_expires_at = NULL "
+                "WHERE id = ?" + _LEASE_HELD,
+                (time.time(), job.id, job.lease_owner, job.attempts))
+        return self._check_lease(cursor, job)
+
+    def fail(self, job: Job, error: str) -> bool:
+        """
+        Records a failed attempt, unless its lease was lost. The job is queued again after the retry
+        delay, or marked as failed if it reached its maximum attempts.
+
+        Args:
+            job (Job): The leased job.
+            error (str): Description of the error.
+
+        Returns:
+            bool: True if the attempt was recorded, False if the lease was lost and the result dropped.
+        """
+        now = time.time()
+        with self._lock:
+            cursor = self._db.execute(
+                "UPDATE jobs SET status = CASE WHEN attempts >= max_attempts THEN 'failed' ELSE 'queued' END, "
+                "available_at = ?, finished_at = CASE WHEN attempts >= max_attempts THEN ? END, "
+                "lease_owner = NULL, lease_expires_at = NULL, last_error = ? WHERE id = ?" + _LEASE_HELD,
+                (now + RETRY_DELAY * 2 ** (job.attempts - 1), now, error, job.id, job.lease_owner, job.attempts))
+        return self._check_lease(cursor, job)
+
+    @staticmethod
+    def _check_lease(cursor, job: Job) -> bool:
+        """Logs a result dropped because its lease was lost."""
+        if not cursor.rowcount:
+            logger.warning(f"{job} lost its lease, its result is dropped.")
+        return bool(cursor.rowcount)
+
+    def counts(self) -> dict:
+        """
+        Returns the number of jobs in every status ('queued', 'leased', 'done', 'failed').
+
+        Returns:
+            dict: The number of jobs per status.
+        """
+        with self._lock:
+            rows = self._db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        counts = {'queued': 0, 'leased': 0, 'done': 0, 'failed': 0}
+        counts.update(rows)
+        return counts
+
+    def depth(self) -> int:
+        """
+        Returns the number of jobs waiting to be done (queued or leased).
+
+        Returns:
+            int: The queue depth.
+        """
+        counts = self.counts()
+        return counts['queued'] + counts['leased']
+
+
+class WorkerPool:
+    """
+    Pool of worker threads taking jobs from a JobQueue and running them with a shared handler,
+    so all the workers share the same warm clients, caches and tokens.
+
+    Attributes:
+        queue (JobQueue): The job queue.
+        handler (callable): Function called with each Job. Raising an exception fails the attempt.
+        workers (int): Number of worker threads.
+    """
+
+    def __init__(self, queue: JobQueue, handler, workers: int = 4, lease_seconds: float = LEASE_SECONDS,
+                 poll_interval: float = POLL_INTERVAL):
+        self.queue = queue
+        self.handler = handler
+        self.workers = workers
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._latencies = []
+        self._failed = 0
+        self._started_at = None
+
+    def run(self, until_empty: bool = False):
+        """
+        Runs the workers until `stop` is called, or until the queue is empty.
+
+        Args:
+            until_empty (bool): Whether to return once no job is queued or leased.
+        """
+        self._started_at = time.monotonic()
+        threads = [threading.Thread(target=in_current_stage(self._work), args=(f"worker-{i}", until_empty),
+                                    name=f"worker-{i}")
+                   for i in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        try:
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(self.poll_interval)
+        except KeyboardInterrupt:
+            logger.warning("Stopping the workers after their current job.")
+            self.stop()
+            for thread in threads:
+                thread.join()
+        logger.info(f"Worker pool stopped: {self.stats()}")
+
+    def stop(self):
+        """Asks the workers to stop after their current job."""
+        self._stop.set()
+
+    def _work(self, worker_id: str, until_empty: bool):
+        """Leases and runs jobs until stopped."""
+        while not self._stop.is_set():
+            job = self.queue.lease(worker_id, self.lease_seconds)
+            if job is None:
+                if until_empty and self.queue.depth() == 0:
+                    return
+                self._stop.wait(self.poll_interval)
+                continue
+
+            start = time.monotonic()
+            logger.info(f"{worker_id} started {job}")
+            try:
+                self.handler(job)
+            except Exception as e:
+                logger.error(f"{worker_id} failed {job}: {e}")
+                if self.queue.fail(job, str(e)):
+                    with self._lock:
+                        self._failed += 1
+                continue
+
+            if not self.queue.complete(job):
+                continue
+            latency = time.monotonic() - start
+            with self._lock:
+                self._latencies.append(latency)
+            logger.info(f"{worker_id} completed {job} in {latency:.2f}s ({self.stats()})")
+
+    def stats(self) -> dict:
+        """
+        Returns the queue depth, the job latency and the throughput of the pool.
+
+        Returns:
+            dict: 'queue_depth', 'completed', 'failed', 'latency_p50', 'latency_p95' (seconds)
+            and 'throughput' (completed jobs per minute).
+        """
+        with self._lock:
+            latencies = sorted(self._latencies)
+            failed = self._failed
+        elapsed = time.monotonic() - self._started_at if self._started_at else 0
+        return {
+            'queue_depth': self.queue.depth(),
+            'completed': len(latencies),
+            'failed': failed,
+            'latency_p50': round(latencies[len(latencies) // 2], 3) if latencies else None,
+            'latency_p95': round(latencies[int(len(latencies) * 0.95)], 3) if latencies else None,
+            'throughput': round(len(latencies) * 60 / elapsed, 2) if elapsed else 0.0,
+        }
@@ -0,0 +1,303 @@
+import os
+import logging
+import urllib.parse
+import datetime
+import threading
+
+import numpy as np
+
+from logging_config import setup_logging
+
+setup_logging()  # Ensure the logger is set up
+logger = logging.getLogger(__name__)
+
+# Directory holding the popularity matrix and the track ID dictionary
+HISTORY_DIR = 'popularity_history'
+# Column 0 of the matrix is the ISO week starting on this Monday (2024-W01)
+EPOCH = datetime.date(2024, 1, 1)
+# Cell value of a track that was not seen in a week (popularity is 0-100)
+MISSING = 255
+# The matrix grows by this many weeks at a time, and at least doubles its tracks
+WEEKS_PER_BLOCK = 53
+MIN_TRACKS = 1024
+
+
+def week_column(year, week_of_the_year) -> int:
+    """
+    Returns the matrix column of an ISO week.
+
+    Args:
+        year (int): The ISO year.
+        week_of_the_year (int): The ISO week number.
+
+    Returns:
+        int: The column index.
+
+    Raises:
+        ValueError: If the week is before EPOCH.
+    """
+    monday = datetime.date.fromisocalendar(int(year), int(week_of_the_year), 1)
+    column = (monday - EPOCH).days // 7
+    if column < 0:
+        raise ValueError(f"Week {week_of_the_year} of {year} is before the start of the history ({EPOCH}).")
+    return column
+
+
+class PopularityHistory:
+    """
+    Compact time series of the popularity of every track, week by week.
+
+    The popularity is stored in a memory-mapped uint8 matrix (`popularity.npy`, track x ISO week)
+    with MISSING for weeks where a track was not seen, and the track IDs in `track_ids.txt`, one
+    per line in row order. Loading maps the matrix without reading it; all the queries are
+    vectorized over the tracks. Ranks, climbers and new entries are computed over every track of
+    the history, so a history holds a single genre (see GenreHistories).
+
+    Attributes:
+        path (str): The history directory.
+        track_ids (list): The track ID of every row.
+    """
+
+    def __init__(self, path: str = HISTORY_DIR):
+        """
+        Opens the history, creating an empty one if it does not exist.
+
+        Args:
+            path (str): The history directory.
+        """
+        self.path = path
+        self._matrix_path = os.path.join(path, 'popularity.npy')
+        self._ids_path = os.path.join(path, 'track_ids.txt')
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+        self.track_ids = []
+        if os.path.exists(self._ids_path):
+            with open(self._ids_path, 'r', encoding='utf-8') as ids_file:
+                self.track_ids = ids_file.read().split()
+        self._rows = {track_id: row for row, track_id in enumerate(self.track_ids)}
+
+        if os.path.exists(self._matrix_path):
+            self._matrix = np.load(self._matrix_path, mmap_mode='r+')
+        else:
+            self._matrix = self._create(self._matrix_path, (MIN_TRACKS, WEEKS_PER_BLOCK))
+        logger.info(f"Popularity history loaded from {path} with {len(self.track_ids)} tracks.")
+
+    @staticmethod
+    def _create(path, shape):
+        """Creates a matrix file filled with MISSING and returns it memory-mapped."""
+        matrix = np.lib.format.open_memmap(path, mode='w+', dtype=np.uint8, shape=shape)
+        matrix[:] = MISSING
+        return matrix
+
+    def _ensure_capacity(self, rows, columns):
+        """Grows the matrix file so it holds at least the given number of rows and columns."""
+        capacity_rows, capacity_columns = self._matrix.shape
+        if rows <= capacity_rows and columns <= capacity_columns:
+            return
+
+        shape = (max(rows, 2 * capacity_rows) if rows > capacity_rows else capacity_rows,
+                 max(capacity_columns, -(-columns // WEEKS_PER_BLOCK) * WEEKS_PER_BLOCK))
+        tmp_path = f"{self._matrix_path}.tmp.npy"
+        grown = self._create(tmp_path, shape)
+        grown[:capacity_rows, :capacity_columns] = self._matrix
+        grown.flush()
+        del grown
+        self._matrix = None  # Release the old mapping before replacing the file
+        os.replace(tmp_path, self._matrix_path)
+        self._matrix = np.load(self._matrix_path, mmap_mode='r+')
+        logger.info(f"Popularity history grown to {shape[0]} tracks x {shape[1]} weeks.")
+
+    def record(self, tracks, year, week_of_the_year):
+        """
+        Stores the popularity of the tracks for a week. Tracks without a Spotify ID are ignored.
+
+        Args:
+            tracks (list): A list of Track objects.
+            year (int): The ISO year.
+            week_of_the_year (int): The ISO week number.
+        """
+        column = week_column(year, week_of_the_year)
+        tracks = [song for song in tracks if song.track_id]
+        if not tracks:
+            return
+
+        with self._lock:
+            new_ids = [song.track_id for song in tracks if song.track_id not in self._rows]
+            new_ids = list(dict.fromkeys(new_ids))
+            if new_ids:
+                with open(self._ids_path, 'a', encoding='utf-8') as ids_file:
+                    ids_file.writelines(f"{track_id}\n" for track_id in new_ids)
+                for track_id in new_ids:
+                    self._rows[track_id] = len(self.track_ids)
+                    self.track_ids.append(track_id)
+
+            self._ensure_capacity(len(self.track_ids), column + 1)
+            rows = np.fromiter((self._rows[song.track_id] for song in tracks), dtype=np.intp, count=len(tracks))
+            popularity = np.clip([song.popularity for song in tracks], 0, 100).astype(np.uint8)
+            self._matrix[rows, column] = popularity
+            self._matrix.flush()
+        logger.info(f"Recorded the popularity of {len(tracks)} tracks for week {week_of_the_year} of {year}.")
+
+    def _week(self, column):
+        """Returns the popularity of every track in a column as float, with NaN where missing."""
+        values = np.full(len(self.track_ids), np.nan, dtype=np.float32)
+        if 0 <= column < self._matrix.shape[1]:
+            cells = self._matrix[:len(self.track_ids), column]
+            present = cells != MISSING
+            values[present] = cells[present]
+        return values
+
+    def popularity(self, year, week_of_the_year) -> np.ndarray:
+        """
+        Returns the popularity of every track in a week.
+
+        Args:
+            year (int): The ISO year.
+            week_of_the_year (int): The ISO week number.
+
+        Returns:
+            numpy.ndarray: The popularity of every track in the week, NaN where the track was not seen.
+        """
+        return self._week(week_column(year, week_of_the_year))
+
+    def deltas(self, year, week_of_the_year, weeks_back=1) -> np.ndarray:
+        """
+        Returns the popularity change of every track compared with a previous week.
+
+        Args:
+            year (int): The ISO year.
+            week_of_the_year (int): The ISO week number.
+            weeks_back (int): Number of weeks to compare with. Default is 1.
+
+        Returns:
+            numpy.ndarray: The popularity change of every track, NaN where it was not seen in both weeks.
+        """
+        column = week_column(year, week_of_the_year)
+        return self._week(column) - self._week(column - weeks_back)
+
+    def rolling_average(self, year, week_of_the_year, window=4) -> np.ndarray:
+        """
+        Returns the average popularity of every track over the last weeks.
+
+        Args:
+            year (int): The ISO year.
+            week_of_the_year (int): The ISO week number.
+            window (int): Number of weeks, ending with the given one. Default is 4.
+
+        Returns:
+            numpy.ndarray: The average popularity of every track over the weeks it was seen, NaN if never.
+        """
+        column = week_column(year, week_of_the_year)
+        start = max(column - window + 1, 0)
+        block = self._matrix[:len(self.track_ids), start:column + 1]
+        present = block != MISSING
+        sums = np.where(present, block, 0).sum(axis=1, dtype=np.float32)
+        counts = present.sum(axis=1)
+        return np.divide(sums, counts, out=np.full(len(self.track_ids), np.nan, dtype=np.float32), where=counts > 0)
+
+    def ranks(self, year, week_of_the_year) -> np.ndarray:
+        """
+        Returns the rank of every track by popularity in a week.
+
+        Args:
+            year (int): The ISO year.
+            week_of_the_year (int): The ISO week number.
+
+        Returns:
+            numpy.ndarray: The rank of every track by popularity (1 = most popular), NaN where not seen.
+        """
+        values = self.popularity(year, week_of_the_year)
+        present = np.flatnonzero(~np.isnan(values))
+        order = present[np.argsort(-values[present], kind='stable')]
+        ranks = np.full(len(values), np.nan, dtype=np.float32)
+        ranks[order] = np.arange(1, len(order) + 1)
+        return ranks
+
+    def rank_changes(self, year, week_of_the_year) -> np.ndarray:
+        """
+        Returns the rank change of every track since the previous week.
+
+        Args:
+            year (int): The ISO year.
+            week_of_the_year (int): The ISO week number.
+
+        Returns:
+            numpy.ndarray: Positions climbed by every track since the previous week (negative = fell),
+            NaN where it was not seen in both weeks.
+        """
+        monday = datetime.date.fromisocalendar(int(year), int(week_of_the_year), 1)
+        previous_year, previous_week, _ = (monday - datetime.timedelta(weeks=1)).isocalendar()
+        return self.ranks(previous_year, previous_week) - self.ranks(year, week_of_the_year)
+
+    def biggest_climbers(self, year, week_of_the_year, limit=5) -> list:
+        """
+        Returns the tracks whose popularity grew the most since the previous week.
+
+        Args:
+            year (int): The ISO year.
+            week_of_the_year (int): The ISO week number.
+            limit (int): Maximum number of tracks to return. Default is 5.
+
+        Returns:
+            list: (track_id, popularity change) of the tracks whose popularity grew the most since the previous week.
+        """
+        deltas = self.deltas(year, week_of_the_year)
+        climbers = np.flatnonzero(deltas > 0)
+        climbers = climbers[np.argsort(-deltas[climbers], kind='stable')][:limit]
+        return [(self.track_ids[row], int(deltas[row])) for row in climbers]
+
+    def new_entries(self, year, week_of_the_year) -> list:
+        """
+        Returns the tracks seen for the first time in a week.
+
+        Args:
+            year (int): The ISO year.
+            week_of_the_year (int): The ISO week number.
+
+        Returns:
+            list: The IDs of the tracks seen in the week and never before.
+        """
+        column = week_column(year, week_of_the_year)
+        if column >= self._matrix.shape[1]:
+            return []
+        block = self._matrix[:len(self.track_ids), :column + 1] != MISSING
+        new = block[:, -1] & ~block[:, :-1].any(axis=1)
+        return [self.track_ids[row] for row in np.flatnonzero(new)]
+
+
+class GenreHistories:
+    """
+    One PopularityHistory per genre, stored in `<path>/<genre>` and opened on first use, so the
+    charts of different genres never share a week column.
+
+    Attributes:
+        path (str): The directory holding the history of every genre.
+    """
+
+    def __init__(self, path: str = HISTORY_DIR):
+        """
+        Initializes the histories. No history is opened until it is used.
+
+        Args:
+            path (str): The directory holding the history of every genre.
+        """
+        self.path = path
+        self._histories = {}
+        self._lock = threading.Lock()
+
+    def get(self, genre: str) -> PopularityHistory:
+        """
+        Returns the history of a genre, creating it if it does not exist.
+
+        Args:
+            genre (str): The genre.
+
+        Returns:
+            PopularityHistory: The history of the genre.
+        """
+        with self._lock:
+            if genre not in self._histories:
+                directory = os.path.join(self.path, urllib.parse.quote(genre, safe=''))
+                self._histories[genre] = PopularityHistory(directory)
+            return self._histories[genre]
@@ -0,0 +1,373 @@
+import io
+import os
+import sys
+import time
+import pstats
+import cProfile
+import logging
+import functools
+import threading
+import contextlib
+import tracemalloc
+from collections import Counter
+from logging_config import setup_logging
+
+setup_logging()  # Ensure the logger is set up
+logger = logging.getLogger(__name__)
+
+# Seconds between two stack samples
+SAMPLE_INTERVAL = 0.005
+# Number of functions and allocation sites listed per stage in the summary
+TOP_ENTRIES = 10
+
+# Allocations made by tracemalloc and the profiler themselves are left out of the reports
+_SNAPSHOT_FILTERS = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+
+# The active profiler, or None when profiling is off
+_active = None
+_NULL_STAGE = contextlib.nullcontext()
+
+
+class StageStats:
+    """
+    Aggregated measurements of one profiling stage.
+
+    Attributes:
+        name (str): The stage path, e.g. 'main/fetch_tracks'.
+        calls (int): Number of times the stage ran.
+        wall_time (float): Total wall time in seconds, including nested stages.
+        peak_memory (int): Highest traced memory in bytes while the stage ran.
+        stats (pstats.Stats): cProfile statistics, excluding nested stages.
+        allocations (Counter): Net allocated bytes per source line.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.wall_time = 0.0
+        self.peak_memory = 0
+        self.stats = None
+        self.allocations = Counter()
+
+
+def _enable(profile):
+    """Enables a cProfile profiler, unless another thread already runs one (Python 3.12+ allows only one)."""
+    try:
+        profile.enable()
+    except ValueError:
+        pass
+
+
+def _snapshot():
+    """Takes a tracemalloc snapshot without the allocations of tracemalloc and the profiler."""
+    return tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+
+
+class _Frame:
+    """A running stage on the stack of a thread."""
+
+    def __init__(self, path):
+        self.path = path
+        self.profile = cProfile.Profile()
+        self.peak_memory = 0
+
+
+class Profiler:
+    """
+    Collects per-stage cProfile statistics, sampled stacks and tracemalloc peaks and allocation sites.
+
+    Stages can be nested: the cProfile statistics of a stage exclude its nested stages, while the
+    wall time and the memory peak include them. Every thread is sampled; functions run in other
+    threads through `in_current_stage` are sampled and profiled as part of the stage that started
+    them. Memory peaks are process-wide.
+
+    Attributes:
+        output_dir (str): Directory where the reports are written.
+        interval (float): Seconds between two stack samples.
+        stages (dict): The StageStats of every stage, keyed by stage path.
+    """
+
+    def __init__(self, output_dir='profile', interval=SAMPLE_INTERVAL):
+        self.output_dir = output_dir
+        self.interval = interval
+        self.stages = {}
+        self._samples = Counter()
+        self._stacks = {}  # Thread ID -> list of running _Frame
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sampler = None
+
+    def start(self):
+        """Starts tracing memory allocations and sampling stacks."""
+        tracemalloc.start()
+        self._sampler = threading.Thread(target=self._sample, name='profiler-sampler', daemon=True)
+        self._sampler.start()
+        logger.info(f"Profiling enabled, reports will be written to {self.output_dir}")
+
+    def stop(self):
+        """Stops sampling and tracing and writes the reports."""
+        self._stop.set()
+        self._sampler.join()
+        tracemalloc.stop()
+        self.write_reports()
+
+    def _sample(self):
+        """
+        Records the Python stack of every thread, until stopped. Threads outside any stage are
+        recorded under their thread name.
+        """
+        sampler_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+            with self._lock:
+                paths = {thread_id: stack[-1].path for thread_id, stack in self._stacks.items() if stack}
+            for thread_id, frame in frames.items():
+                if thread_id == sampler_id:
+                    continue
+                path = paths.get(thread_id) or f"[{thread_names.get(thread_id, thread_id)}]"
+                names = []
+                while frame is not None:
+                    code = frame.f_code
+                    names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                names.reverse()
+                self._samples[';'.join(path.split('/') + names)] += 1
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """
+        Profiles the enclosed block as a stage.
+
+        Args:
+            name (str): The stage name. Nested stages are reported as 'outer/inner'.
+        """
+        thread_id = threading.get_ident()
+        with self._lock:
+            stack = self._stacks.setdefault(thread_id, [])
+        parent = stack[-1] if stack else None
+        frame = _Frame(f"{parent.path}/{name}" if parent else name)
+
+        if parent:
+            parent.profile.disable()
+            parent.peak_memory = max(parent.peak_memory, tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+        snapshot = _snapshot()
+        with self._lock:
+            stack.append(frame)
+        start = time.perf_counter()
+        _enable(frame.profile)
+        try:
+            yield
+        finally:
+            frame.profile.disable()
+            wall_time = time.perf_counter() - start
+            with self._lock:
+                stack.pop()
+            frame.peak_memory = max(frame.peak_memory, tracemalloc.get_traced_memory()[1])
+            allocations = _snapshot().compare_to(snapshot, 'lineno')
+            self._add(frame, wall_time, allocations)
+            if parent:
+                parent.peak_memory = max(parent.peak_memory, frame.peak_memory)
+                tracemalloc.reset_peak()
+                _enable(parent.profile)
+
+    def in_current_stage(self, function):
+        """
+        Wraps a function that will run in another thread (an executor task or a thread target), so
+        it is sampled and profiled as part of the stage running in the calling thread.
+
+        Args:
+            function (callable): The function.
+
+        Returns:
+            callable: The wrapped function, or the function itself outside any stage.
+        """
+        with self._lock:
+            stack = self._stacks.get(threading.get_ident())
+            parent = stack[-1] if stack else None
+        if parent is None:
+            return function
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            # cProfile only profiles the thread that enabled it, so each task has its own profiler
+            frame = _Frame(parent.path)
+            with self._lock:
+                stack = self._stacks.setdefault(threading.get_ident(), [])
+                stack.append(frame)
+            _enable(frame.profile)
+            try:
+                return function(*args, **kwargs)
+            finally:
+                frame.profile.disable()
+                with self._lock:
+                    stack.pop()
+                    self._add_stats(self.stages.setdefault(frame.path, StageStats(frame.path)), frame.profile)
+        return wrapper
+
+    def _add(self, frame, wall_time, allocations):
+        """Adds the measurements of a finished stage to its StageStats."""
+        with self._lock:
+            stage = self.stages.setdefault(frame.path, StageStats(frame.path))
+            stage.calls += 1
+            stage.wall_time += wall_time
+            stage.peak_memory = max(stage.peak_memory, frame.peak_memory)
+            for diff in allocations:
+                if diff.size_diff > 0:
+                    stage.allocations[str(diff.traceback[0])] += diff.size_diff
+            self._add_stats(stage, frame.profile)
+
+    @staticmethod
+    def _add_stats(stage, profile):
+        """Adds the cProfile statistics of a profiler to a StageStats."""
+        try:
+            if stage.stats is None:
+                stage.stats = pstats.Stats(profile)
+            else:
+                stage.stats.add(profile)
+        except TypeError:
+            pass  # The profiler made no profiled calls
+
+    def instrument(self, cls, method_names=None):
+        """
+        Wraps methods of a class so every call runs as a stage named 'Class.method'.
+
+        Args:
+            cls (type): The class to instrument.
+            method_names (list): The methods to wrap. Default is every public method.
+
+        Returns:
+            callable: A function that restores the original methods.
+        """
+        if method_names is None:
+            method_names = [name for name, value in vars(cls).items() if callable(value) and not name.startswith('_')]
+
+        originals = {}
+        for name in method_names:
+            originals[name] = getattr(cls, name)
+            setattr(cls, name, self._wrap(originals[name], f"{cls.__name__}.{name}"))
+
+        def restore():
+            for name, method in originals.items():
+                setattr(cls, name, method)
+        return restore
+
+    def _wrap(self, method, name):
+        """Returns a wrapper running every call of the method as a stage."""
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            with self.stage(name):
+                return method(*args, **kwargs)
+        return wrapper
+
+    def write_reports(self):
+        """
+        Writes the reports to the output directory:
+        `stacks.collapsed` (flamegraph.pl / speedscope format), `summary.txt` and one `<stage>.prof` per stage.
+
+        Raises:
+            OSError: If writing the reports fails.
+        """
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+
+            with open(os.path.join(self.output_dir, 'stacks.collapsed'), 'w') as collapsed:
+                collapsed.writelines(f"{stack} {count}\n" for stack, count in self._samples.items())
+
+            for stage in self.stages.values():
+                if stage.stats is not None:
+                    stage.stats.dump_stats(os.path.join(self.output_dir, f"{stage.name.replace('/', '__')}.prof"))
+
+            with open(os.path.join(self.output_dir, 'summary.txt'), 'w') as summary:
+                summary.write(self.summary())
+            logger.info(f"Profiling reports written to {self.output_dir}")
+        except OSError as e:
+            logger.error(f"Error writing profiling reports: {e}")
+            raise
+
+    def summary(self) -> str:
+        """
+        Builds the summary table and the top functions and allocation sites of every stage.
+
+        Returns:
+            str: The summary.
+        """
+        lines = [f"{'Stage':<60} {'Calls':>6} {'Wall (s)':>10} {'Peak (KiB)':>12}"]
+        for stage in self.stages.values():
+            lines.append(f"{stage.name:<60} {stage.calls:>6} {stage.wall_time:>10.3f} {stage.peak_memory / 1024:>12.1f}")
+
+        for stage in self.stages.values():
+            lines.append(f"\n=== {stage.name} ===")
+            if stage.stats is not None:
+                stream = io.StringIO()
+                stage.stats.stream = stream
+                stage.stats.sort_stats('cumulative').print_stats(TOP_ENTRIES)
+                lines.append(stream.getvalue().strip())
+            lines.append("Top allocation sites:")
+            for site, size in stage.allocations.most_common(TOP_ENTRIES):
+                lines.append(f"  {size / 1024:>10.1f} KiB  {site}")
+        return "\n".join(lines) + "\n"
+
+
+def stage(name):
+    """
+    Profiles the enclosed block as a stage of the active profiler. Does nothing when profiling is off.
+
+    Args:
+        name (str): The stage name.
+
+    Returns:
+        contextlib.AbstractContextManager: The stage block.
+    """
+    if _active is None:
+        return _NULL_STAGE
+    return _active.stage(name)
+
+
+def in_current_stage(function):
+    """
+    Wraps a function that will run in another thread, so the active profiler attributes it to the
+    current stage. Returns the function itself when profiling is off.
+
+    Args:
+        function (callable): The function.
+
+    Returns:
+        callable: The wrapped function.
+    """
+    if _active is None:
+        return function
+    return _active.in_current_stage(function)
+
+
+@contextlib.contextmanager
+def profile(output_dir=None, instrument=()):
+    """
+    Enables profiling inside the block and writes the reports when it exits. Does nothing if
+    `output_dir` is None, so the instrumented classes are left untouched when profiling is off.
+
+    Args:
+        output_dir (str): Directory where the reports are written, or None to disable profiling.
+        instrument (list): Classes whose public methods are profiled as stages.
+
+    Yields:
+        Profiler: The active profiler, or None when profiling is off.
+    """
+    global _active
+    if output_dir is None:
+        yield None
+        return
+
+    profiler = Profiler(output_dir)
+    restores = [profiler.instrument(cls) for cls in instrument]
+    _active = profiler
+    profiler.start()
+    try:
+        with profiler.stage('main'):
+            yield profiler
+    finally:
+        _active = None
+        for restore in restores:
+            restore()
+        profiler.stop()
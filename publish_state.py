@@ -0,0 +1,111 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+from logging_config import setup_logging
+
+setup_logging()  # Ensure the logger is set up
+logger = logging.getLogger(__name__)
+
+# File where the last published state of every week is stored
+STATE_FILE = 'publish_state.json'
+
+
+def week_key(blog_id, genre, year, week_of_the_year) -> str:
+    """
+    Builds the key under which the state of a week of a blog and genre is stored.
+
+    Args:
+        blog_id (str): The Blogger blog.
+        genre (str): The genre.
+        year (int): The year.
+        week_of_the_year (int): The ISO week number.
+
+    Returns:
+        str: The key, e.g. '<blog_id>/rock/2024-W21'.
+    """
+    return f"{blog_id}/{genre}/{year}-W{int(week_of_the_year):02d}"
+
+
+def content_hash(track_ids: list, texts: list) -> str:
+    """
+    Computes a hash of the inputs of a weekly run.
+
+    Args:
+        track_ids (list): The ordered Spotify track IDs.
+        texts (list): The generated texts (introduction and track descriptions).
+
+    Returns:
+        str: The SHA-256 hex digest of the inputs.
+    """
+    payload = json.dumps([track_ids, texts], ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class PublishState:
+    """
+    Keeps track of what was last published for each week, so reruns can skip unchanged work
+    and update the existing playlist and blog post in place.
+
+    Attributes:
+        path (str): The JSON file where the state is stored.
+        weeks (dict): The stored state, keyed by `week_key`.
+    """
+
+    def __init__(self, path: str = STATE_FILE):
+        """
+        Loads the state from disk. A missing or unreadable file starts an empty state.
+
+        Args:
+            path (str): The JSON file where the state is stored.
+        """
+        self.path = path
+        self.weeks = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as state_file:
+                    self.weeks = json.load(state_file)
+                logger.info(f"Publish state loaded from {path}")
+            except (OSError, ValueError) as e:
+                logger.warning(f"Could not read publish state from {path}, starting empty: {e}")
+
+    def get(self, key: str) -> dict:
+        """
+        Returns the last published state of a week.
+
+        Args:
+            key (str): The week key.
+
+        Returns:
+            dict: The stored state, or an empty dict if the week was never published.
+        """
+        with self._lock:
+            return dict(self.weeks.get(key, {}))
+
+    def update(self, key: str, **fields):
+        """
+        Updates the state of a week and writes it to disk.
+
+        Args:
+            key (str): The week key.
+            **fields: The fields to store for the week.
+
+        Raises:
+            OSError: If writing the file fails.
+        """
+        with self._lock:
+            self.weeks.setdefault(key, {}).update(fields)
+            self._save()
+
+    def _save(self):
+        """Writes the state to disk atomically. Must be called with the lock held."""
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as state_file:
+                json.dump(self.weeks, state_file, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.error(f"Error saving publish state to {self.path}: {e}")
+            raise
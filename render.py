@@ -0,0 +1,163 @@
+import re
+import html
+import json
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from xml.sax.saxutils import escape as xml_escape
+
+from logging_config import setup_logging
+
+setup_logging()  # Ensure the logger is set up
+logger = logging.getLogger(__name__)
+
+# Formats produced by render_tracks
+FORMATS = ('html', 'text', 'markdown', 'rss', 'json')
+# Maximum number of track fragments kept in memory
+FRAGMENT_CACHE_SIZE = 4096
+
+_MARKDOWN_SPECIAL = re.compile(r'([\\`*_\[\]#|<>])')
+
+
+def escape_markdown(text: str) -> str:
+    """
+    Escapes the characters with a meaning in Markdown.
+
+    Args:
+        text (str): The text to escape.
+
+    Returns:
+        str: The escaped text.
+    """
+    return _MARKDOWN_SPECIAL.sub(r'\\\1', text)
+
+
+class TrackFragment:
+    """
+    The rendered pieces of one track that do not change from week to week, in every format,
+    without its position in the list and its description.
+
+    Attributes:
+        id (str): Stable identifier of the track in the feeds: its Spotify URI, or a hash of its fields.
+        html (str): HTML between the position number and the description.
+        markdown (str): Markdown between the position number and the description.
+        title (str): Plain-text title, used by the feeds.
+    """
+
+    def __init__(self, track_id, name, artist, release_date):
+        """
+        Builds the pieces of a track.
+
+        Args:
+            track_id (str): The Spotify ID of the track, if known.
+            name (str): The name of the track.
+            artist (str): The name of the artist.
+            release_date (str): The release date of the track.
+        """
+        if track_id:
+            self.id = f"spotify:track:{track_id}"
+        else:
+            self.id = hashlib.sha256(json.dumps([name, artist, release_date], ensure_ascii=False).encode('utf-8')).hexdigest()
+        self.html = f" - {html.escape(name)}</b> - <b>{html.escape(artist)}</b> - Release date: {html.escape(release_date)}<br>\n"
+        self.markdown = f" **{escape_markdown(name)}** - **{escape_markdown(artist)}** - Release date: {escape_markdown(release_date)}\n\n"
+        self.title = f"{name} - {artist}"
+
+
+_fragments = OrderedDict()
+_fragments_lock = threading.Lock()
+
+
+def fragment_key(song) -> tuple:
+    """
+    Returns the memo key of a track: its ID and the stable fields that are rendered. The description
+    is left out, since it is generated again every week.
+
+    Args:
+        song (Track): The track.
+
+    Returns:
+        tuple: The key.
+    """
+    return getattr(song, 'track_id', None), song.name, song.artist, song.release_date
+
+
+def get_fragment(song) -> TrackFragment:
+    """
+    Returns the fragment of a track, building it only if the same track was not rendered before.
+
+    Args:
+        song (Track): The track.
+
+    Returns:
+        TrackFragment: The fragment of the track.
+    """
+    key = fragment_key(song)
+    with _fragments_lock:
+        fragment = _fragments.get(key)
+        if fragment is not None:
+            _fragments.move_to_end(key)
+            return fragment
+
+    fragment = TrackFragment(key[0], str(song.name), str(song.artist), str(song.release_date or ''))
+    with _fragments_lock:
+        _fragments[key] = fragment
+        if len(_fragments) > FRAGMENT_CACHE_SIZE:
+            _fragments.popitem(last=False)
+    return fragment
+
+
+def render_tracks(songs, introduction='', title='', link='', formats=FORMATS) -> dict:
+    """
+    Renders a list of tracks in several formats in one pass, reusing the memoized fragment of every track.
+
+    Args:
+        songs (list): The Track objects, in list order.
+        introduction (str): Optional introduction placed before the tracks.
+        title (str): The title of the feeds.
+        link (str): Optional link of the feeds.
+        formats (tuple): The formats to render, among FORMATS.
+
+    Returns:
+        dict: The rendered output of every requested format.
+    """
+    parts = {name: [] for name in formats}
+    items = []
+
+    if introduction:
+        if 'html' in parts:
+            parts['html'].append(f"<p>{html.escape(introduction)}</p>")
+        if 'text' in parts:
+            parts['text'].append(introduction)
+        if 'markdown' in parts:
+            parts['markdown'].append(f"{escape_markdown(introduction)}\n\n")
+
+    for i, song in enumerate(songs, start=1):
+        fragment = get_fragment(song)
+        description = song.description or ''
+        if 'html' in parts:
+            parts['html'].append(f"<p><b>{i}{fragment.html}{html.escape(description)}<br><br></p>")
+        if 'text' in parts:
+            parts['text'].append(description)
+        if 'markdown' in parts:
+            parts['markdown'].append(f"{i}.{fragment.markdown}   {escape_markdown(description)}\n\n")
+        if 'rss' in parts:
+            parts['rss'].append(f"<item><title>{xml_escape(f'{i} - {fragment.title}')}</title>"
+                                f"<description>{xml_escape(description)}</description>"
+                                f"<guid isPermaLink=\"false\">{fragment.id}</guid></item>")
+        if 'json' in parts:
+            items.append({'id': fragment.id, 'title': f"{i} - {fragment.title}", 'content_text': description})
+
+    rendered = {name: "".join(pieces) for name, pieces in parts.items()}
+    if 'rss' in rendered:
+        rendered['rss'] = (f'<?xml version="1.0" encoding="UTF-8"?>\n<rss version="2.0"><channel>'
+                           f"<title>{xml_escape(title)}</title><link>{xml_escape(link)}</link>"
+                           f"<description>{xml_escape(introduction)}</description>{rendered['rss']}</channel></rss>")
+    if 'json' in rendered:
+        feed = {'version': 'https://jsonfeed.org/version/1.1', 'title': title, 'description': introduction, 'items': items}
+        if link:
+            feed['home_page_url'] = link
+        rendered['json'] = json.dumps(feed, ensure_ascii=False)
+
+    logger.info(f"Rendered {len(songs)} songs as {', '.join(formats)}.")
+    return rendered
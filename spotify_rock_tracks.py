@@ -1,22 +1,51 @@
 import os
+import json
+import asyncio
 import logging
+import inspect
+import sqlite3
+import argparse
 import datetime
+import functools
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 
+import urllib3
+import requests
 import spotipy
 from spotipy.oauth2 import SpotifyOAuth
 from dotenv import load_dotenv
 
+from async_http import acquire_session, hold_session, release_session
 from blogger_api_client import BlogPost, get_credentials
-from chatgpt_api import get_openai_response
+from cassette import REPLAY_TOKEN, CassetteMissError, cassette_from_env, replaying
+from chatgpt_api import aget_openai_response, get_openai_response
 from elevenlaps_api_client import text_to_speech
+from job_queue import QUEUE_FILE, JobQueue, WorkerPool
 from logging_config import setup_logging
+from popularity_history import HISTORY_DIR, GenreHistories
+from profiling import in_current_stage, profile, stage
+from publish_state import STATE_FILE, PublishState, content_hash, week_key
+from render import render_tracks
 
 
 setup_logging()  # Ensure the logger is set up
 logger = logging.getLogger(__name__)
 
+# Genres and markets queried by default. A market of None does not filter by country.
+DEFAULT_GENRES = ['rock']
+DEFAULT_MARKETS = [None]
+# Number of concurrent requests, which is also the size of the HTTP connection pool
+MAX_WORKERS = 8
+# Spotify Web API endpoint used by AsyncSpotifyRockTracks
+SPOTIFY_API_URL = 'https://api.spotify.com/v1/'
+# Retries of a Spotify request answered with 429 or 5xx
+MAX_RETRIES = 3
+# Playlist fields read back after a playlist is updated
+PLAYLIST_FIELDS = 'id,external_urls'
+
 class Track:
-    def __init__(self, name, artist, popularity, release_date, description):
+    def __init__(self, name, artist, popularity, release_date=None, description=None, track_id=None):
         """
         Initializes a Track object with the given attributes.
 
@@ -26,33 +55,59 @@ class Track:
             popularity (int): The popularity score of the track.
             release_date (str): The release date of the track.
             description (str): A description or extra information about the track.
+            track_id (str): The Spotify ID of the track.
         """
         self.name = name
         self.artist = artist
         self.popularity = popularity
         self.release_date = release_date
         self.description = description
+        self.track_id = track_id
 
     def __str__(self):
         return f"{self.name} - {self.artist} (Popularity: {self.popularity}, Release Date: {self.release_date}, Description: {self.description})"
 
 
-def authenticate_spotify():
+def authenticate_spotify(pool_size=MAX_WORKERS):
     """
     Authenticates the user with Spotify using OAuth 2.0.
     Requires 'playlist-modify-public' and 'playlist-modify-private' scopes.
+    While a cassette is replayed, the client uses a static token and never reads or refreshes `.cache`.
+
+    Args:
+        pool_size (int): Maximum number of pooled connections, so concurrent requests share the client.
 
     Returns:
         spotipy.Spotify: Authenticated Spotify client.
     """
     try:
+        # Passing a session skips spotipy's own, so its retry policy for rate limits (429) and
+        # server errors (5xx) is installed here along with the larger pool
+        retry = urllib3.Retry(
+            total=spotipy.Spotify.max_retries,
+            connect=None,
+            read=False,
+            allowed_methods=frozenset(['GET', 'POST', 'PUT', 'DELETE']),
+            status=spotipy.Spotify.max_retries,
+            backoff_factor=0.3,
+            status_forcelist=spotipy.Spotify.default_retry_codes)
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+
+        if replaying():
+            sp = spotipy.Spotify(auth=REPLAY_TOKEN, requests_session=session)
+            logger.info("Replaying a cassette, using a static Spotify token.")
+            return sp
+
         sp_oauth = SpotifyOAuth(
             client_id=os.getenv('SPOTIPY_CLIENT_ID'),
             client_secret=os.getenv('SPOTIPY_CLIENT_SECRET'),
             redirect_uri=os.getenv('SPOTIPY_REDIRECT_URI'),
             scope="playlist-modify-public playlist-modify-private"
         )
-        sp = spotipy.Spotify(auth_manager=sp_oauth)
+        sp = spotipy.Spotify(auth_manager=sp_oauth, requests_session=session)
         logger.info("Successfully authenticated with Spotify!")
         return sp
     except Exception as e:
@@ -60,139 +115,273 @@ def authenticate_spotify():
         raise
 
 
+def handle_spotify_errors(action, on_error=None):
+    """
+    Logs the errors of a Spotify method, sync or async, as 'Error <action>' (Spotify API errors) or
+    'Unexpected error <action>', so SpotifyRockTracks and AsyncSpotifyRockTracks handle them alike.
+    A request missing from a replayed cassette is always raised, so the replay fails instead of
+    going on with empty results.
+
+    Args:
+        action (str): What the method does, e.g. 'retrieving tracks'.
+        on_error (callable): Returns the value returned in place of raising. If None, errors are re-raised.
+
+    Returns:
+        callable: The method decorator.
+    """
+    def log(e):
+        if isinstance(e, spotipy.exceptions.SpotifyException):
+            logger.error(f"Error {action}: {e}")
+        else:
+            logger.error(f"Unexpected error {action}: {e}")
+
+    def decorator(method):
+        if inspect.iscoroutinefunction(method):
+            @functools.wraps(method)
+            async def wrapper(*args, **kwargs):
+                try:
+                    return await method(*args, **kwargs)
+                except CassetteMissError:
+                    raise
+                except Exception as e:
+                    log(e)
+                    if on_error is None:
+                        raise
+                    return on_error()
+        else:
+            @functools.wraps(method)
+            def wrapper(*args, **kwargs):
+                try:
+                    return method(*args, **kwargs)
+                except CassetteMissError:
+                    raise
+                except Exception as e:
+                    log(e)
+                    if on_error is None:
+                        raise
+                    return on_error()
+        return wrapper
+    return decorator
+
+
+def _no_playlist():
+    return None, None
+
+
 class SpotifyRockTracks:
     """
     Class for managing Spotify authentication and retrieving songs.
     """
 
-    def __init__(self):
+    def __init__(self, genres=None, markets=None, max_workers=MAX_WORKERS, history=None):
         """
         Initializes an instance of SpotifyRockTracks. Loads credentials from a .env file and authenticates with the Spotify API.
+
+        Args:
+            genres (list): Genres to query. The first one is the default of the single-genre methods. Default is DEFAULT_GENRES.
+            markets (list): Markets (ISO 3166-1 alpha-2 country codes) to query. Default is DEFAULT_MARKETS.
+            max_workers (int): Maximum number of concurrent requests. Default is MAX_WORKERS.
+            history (GenreHistories): Optional histories where the popularity of the retrieved tracks is recorded, per genre.
         """
+        self.genres = list(genres or DEFAULT_GENRES)
+        self.markets = list(markets or DEFAULT_MARKETS)
+        self.max_workers = max_workers
+        self.history = history
         try:
             load_dotenv()  # Load environment variables from the .env file
             self.client_id = os.getenv('SPOTIPY_CLIENT_ID')
             self.client_secret = os.getenv('SPOTIPY_CLIENT_SECRET')
             if not self.client_id or not self.client_secret:
                 raise ValueError("Spotify credentials are not properly configured.")
-            self.sp = authenticate_spotify()
+            self.sp = authenticate_spotify(pool_size=max_workers)
             logger.info("Initialization successful.")
         except Exception as e:
             logger.error(f"Error during initialization: {e}")
             self.sp = None
 
-    def get_rock_playlists(self, limit=10):
+    @handle_spotify_errors('retrieving playlists')
+    def get_rock_playlists(self, limit=10, genre=None, market=None):
         """
-        Retrieves the most popular rock playlists from the Spotify API.
+        Retrieves the most popular playlists of a genre from the Spotify API.
 
         Args:
             limit (int): Maximum number of playlists to retrieve. Default is 10.
+            genre (str): The genre. Default is the first configured genre.
+            market (str): Optional market (country code) to search in.
 
         Returns:
-            list: A list of popular rock playlists.
+            list: A list of popular playlists of the genre.
         """
-        try:
-            playlists = self.sp.search(q='genre:rock,year:2024,week:21', type='playlist', limit=limit)
-            logger.info(f"Retrieved {len(playlists['playlists']['items'])} rock playlists.")
-            return playlists['playlists']['items']
-        except spotipy.exceptions.SpotifyException as e:
-            logger.error(f"Error retrieving Spotify playlists: {e}")
-            raise
-        except Exception as e:
-            logger.error(f"Unexpected error retrieving playlists: {e}")
-            raise
+        genre = genre or self.genres[0]
+        # The genre filter only applies to artists and tracks, so playlists are searched by keyword
+        playlists = self.sp.search(**_search_params(genre, 'playlist', limit, market))
+        logger.info(f"Retrieved {len(playlists['playlists']['items'])} {genre} playlists.")
+        return playlists['playlists']['items']
+
+    def get_rock_tracks_week_year(self, limit=5, week_of_the_year=12, year=2024, genre=None, market=None):
+        """
+        Retrieves tracks of a genre for the specified week and year, with their descriptions.
+
+        Args:
+            limit (int): Maximum number of tracks to retrieve. Default is 5.
+            week_of_the_year (int): The week number of the year.
+            year (int): The year.
+            genre (str): The genre. Default is the first configured genre.
+            market (str): Optional market (country code) to search in.
+
+        Returns:
+            list: A list of track objects (songs) from the specified week and year in the genre.
+        """
+        tracks = self.search_rock_tracks_week_year(limit=limit, week_of_the_year=week_of_the_year, year=year,
+                                                   genre=genre, market=market)
+        return self.describe_tracks(tracks, genre=genre)
 
-    def get_rock_tracks_week_year(self, limit=5, week_of_the_year=12, year=2024):
+    @handle_spotify_errors('retrieving tracks', on_error=list)
+    def search_rock_tracks_week_year(self, limit=5, week_of_the_year=12, year=2024, genre=None, market=None):
         """
-        Retrieves rock tracks released in the specified week and year.
+        Retrieves tracks of a genre for the specified week and year, without generating descriptions.
+
+        Spotify search has no week filter: the tracks of the year are returned as ranked by Spotify
+        at the time of the query.
 
         Args:
             limit (int): Maximum number of tracks to retrieve. Default is 5.
             week_of_the_year (int): The week number of the year.
             year (int): The year.
+            genre (str): The genre. Default is the first configured genre.
+            market (str): Optional market (country code) to search in.
 
         Returns:
-            list: A list of track objects (songs) from the specified week and year in the rock genre.
+            list: A list of track objects (songs) from the specified week and year in the genre.
+        """
+        genre = genre or self.genres[0]
+        params = _search_params(f'genre:"{genre}" year:{year}', 'track', limit, market)
+        logger.info(f"Spotify query: {params['q']} (market: {market})")
+        results = self.sp.search(**params)
+
+        tracks = tracks_from_search(results)
+
+        logger.info(f"Retrieved {len(tracks)} {genre} tracks from week {week_of_the_year} of {year}.")
+        self._record_history(tracks, genre)
+        return tracks
+
+    def describe_tracks(self, tracks, numbered=True, genre=None):
+        """
+        Generates the blog description of each track concurrently.
+
+        Args:
+            tracks (list): A list of Track objects.
+            numbered (bool): Whether each description mentions the position of the track in the list.
+            genre (str): The genre of the blog. Default is the first configured genre.
+
+        Returns:
+            list: The same list, with the description of each track filled in.
+        """
+        genre = genre or self.genres[0]
+        positions = [str(i) if numbered else None for i in range(1, len(tracks) + 1)]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            descriptions = list(executor.map(in_current_stage(get_track_description), tracks, positions,
+                                             [genre] * len(tracks)))
+        for song, description in zip(tracks, descriptions):
+            song.description = description
+        return tracks
+
+    def get_tracks_matrix(self, limit=5, week_of_the_year=12, year=2024, describe=True):
+        """
+        Retrieves the tracks of every configured genre and market concurrently, sharing one client.
+
+        Tracks appearing in several cells are deduplicated: every cell references the same Track
+        object, and each unique track is described once, for the genre of the first cell it appears
+        in. Since a track can have a different position in each cell, the descriptions do not
+        mention the position.
+
+        Args:
+            limit (int): Maximum number of tracks to retrieve per cell. Default is 5.
+            week_of_the_year (int): The week number of the year.
+            year (int): The year.
+            describe (bool): Whether to generate the descriptions of the tracks.
+
+        Returns:
+            dict: The tracks of each cell, keyed by (genre, market).
+        """
+        cells = [(genre, market) for genre in self.genres for market in self.markets]
+
+        def search(cell):
+            genre, market = cell
+            return self.search_rock_tracks_week_year(limit=limit, week_of_the_year=week_of_the_year, year=year,
+                                                     genre=genre, market=market)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            cell_tracks = list(executor.map(in_current_stage(search), cells))
+
+        unique_tracks, results = _deduplicate(cells, cell_tracks)
+
+        if describe:
+            for genre, tracks in _group_by_genre(unique_tracks).items():
+                self.describe_tracks(tracks, numbered=False, genre=genre)
+
+        logger.info(f"Retrieved {len(unique_tracks)} unique tracks across {len(cells)} genre/market cells.")
+        return results
+
+    def _record_history(self, tracks, genre):
         """
+        Records the popularity of the tracks in the history of their genre, if there are histories.
+        Errors are logged, not raised.
+
+        The popularity is the value observed now, whatever week was queried, so it is always recorded
+        under the current ISO week.
+
+        Args:
+            tracks (list): A list of Track objects.
+            genre (str): The genre the tracks were retrieved for.
+        """
+        if self.history is None:
+            return
+        year, week_of_the_year, _ = datetime.date.today().isocalendar()
         try:
-            query = f'genre=punck rock,year={year},week={week_of_the_year}'
-            logger.info(f"Spotify query: {query}")
-            results = self.sp.search(q=query, type='track', limit=limit)
-
-            tracks = []
-            for i, item in enumerate(results['tracks']['items'], start=1):
-                song = Track(
-                    name=item['name'],
-                    artist=item['artists'][0]['name'],
-                    popularity=item['popularity'],
-                    release_date=item['album']['release_date'],
-                    description=get_track_description(item, str(i))
-                )
-                tracks.append(song)
-
-            logger.info(f"Retrieved {len(tracks)} rock tracks from week {week_of_the_year} of {year}.")
-            return tracks
-        except spotipy.exceptions.SpotifyException as e:
-            logger.error(f"Error retrieving tracks: {e}")
-            return []
+            self.history.get(genre).record(tracks, year, week_of_the_year)
         except Exception as e:
-            logger.error(f"Unexpected error retrieving tracks: {e}")
-            return []
+            logger.error(f"Error recording popularity history: {e}")
 
-    def get_playlist_tracks(self, playlist_id):
+    @handle_spotify_errors('retrieving playlist tracks', on_error=list)
+    def get_playlist_tracks(self, playlist_id, market=None):
         """
         Retrieves the tracks from a specific Spotify playlist.
 
         Args:
             playlist_id (str): The ID of the playlist on Spotify.
+            market (str): Optional market (country code) to retrieve the tracks for.
 
         Returns:
             list: A list of Track objects from the playlist.
         """
-        try:
-            playlist_tracks = self.sp.playlist_tracks(playlist_id)
-            songs = [
-                Track(
-                    name=item['track']['name'],
-                    artist=item['track']['artists'][0]['name'],
-                    popularity=item['track']['popularity']
-                )
-                for item in playlist_tracks['items']
-            ]
-            logger.info(f"Retrieved {len(songs)} tracks from playlist {playlist_id}.")
-            return songs
-        except spotipy.exceptions.SpotifyException as e:
-            logger.error(f"Error retrieving playlist tracks: {e}")
-            return []
-        except KeyError as e:
-            logger.error(f"Key error while processing tracks: {e}")
-            return []
-        except Exception as e:
-            logger.error(f"Unexpected error retrieving playlist tracks: {e}")
-            return []
+        playlist_tracks = self.sp.playlist_tracks(playlist_id, market=market)
+        songs = tracks_from_playlist(playlist_tracks)
+        logger.info(f"Retrieved {len(songs)} tracks from playlist {playlist_id}.")
+        return songs
 
-    def get_top_rock_tracks(self, limit_playlists=5):
+    @handle_spotify_errors('retrieving top tracks', on_error=list)
+    def get_top_rock_tracks(self, limit_playlists=5, genre=None, market=None):
         """
-        Retrieves the most popular rock tracks from multiple playlists.
+        Retrieves the most popular tracks of a genre from multiple playlists.
 
         Args:
             limit_playlists (int): Maximum number of playlists to process. Default is 5.
+            genre (str): The genre. Default is the first configured genre.
+            market (str): Optional market (country code) to search in.
 
         Returns:
             list: A list of the most popular tracks, sorted by popularity.
         """
-        try:
-            playlists = self.get_rock_playlists(limit=limit_playlists)
-            all_songs = []
-            for playlist in playlists:
-                songs = self.get_playlist_tracks(playlist['id'])
-                all_songs.extend(songs)
-            top_songs = sorted(all_songs, key=lambda x: x.popularity, reverse=True)
-            logger.info(f"Retrieved a total of {len(top_songs)} songs.")
-            return top_songs
-        except Exception as e:
-            logger.error(f"Error retrieving top tracks: {e}")
-            return []
+        genre = genre or self.genres[0]
+        playlists = self.get_rock_playlists(limit=limit_playlists, genre=genre, market=market)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            playlist_songs = executor.map(
+                in_current_stage(lambda playlist: self.get_playlist_tracks(playlist['id'], market=market)), playlists)
+        top_songs = _by_popularity(playlist_songs)
+        logger.info(f"Retrieved a total of {len(top_songs)} songs.")
+        self._record_history(top_songs, genre)
+        return top_songs
 
     def display_top_tracks_text(self, top_songs):
         """
@@ -210,9 +399,7 @@ class SpotifyRockTracks:
 
         try:
             if top_songs:
-                text_output = ""
-                for song in top_songs[:5]:
-                    text_output += song.description
+                text_output = render_tracks(top_songs[:5], formats=('text',))['text']
                 logger.info(f"Generated text for {len(top_songs)} songs: {text_output}")
                 return text_output
             else:
@@ -238,10 +425,7 @@ class SpotifyRockTracks:
 
         try:
             if top_songs:
-                html_output = ""
-                for i, song in enumerate(top_songs[:5], start=1):
-                    html_output += f"<p><b>{i} - {song.name}</b> - <b>{song.artist}</b> - Release date: {song.release_date}<br>\n"
-                    html_output += f"{song.description}<br><br></p>"
+                html_output = render_tracks(top_songs[:5], formats=('html',))['html']
                 logger.info(f"Generated HTML for {len(top_songs)} songs.")
                 return html_output
             else:
@@ -263,50 +447,298 @@ class SpotifyRockTracks:
         Returns:
             str: The link to the created playlist.
         """
-        try:
-            logger.info(f"playlist to create: {playlist_name}")
+        playlist_id, playlist_url = self.publish_playlist(playlist_name, songs, playlist_description)
+        return playlist_url
 
-            # Verify if the user is authenticated
-            if not self.sp:
-                logger.error("Error: the user is not authenticated to create a playlist.")
-                return None
+    # In case of error, nothing is returned, so the program is not blocked
+    @handle_spotify_errors('publishing the playlist', on_error=_no_playlist)
+    def publish_playlist(self, playlist_name, songs, playlist_description="", playlist_id=None):
+        """
+        Creates a new playlist on Spotify, or replaces the items of an existing one, with the given songs.
 
-            # Get the         
+        Args:
+            playlist_name (str): The name of the playlist.
+            songs (list): A list of Track objects representing the songs of the playlist.
+            playlist_description (str): Optional description for the playlist.
+            playlist_id (str): The ID of an existing playlist to update in place. If None, a new playlist is created.
+
+        Returns:
+            tuple: The ID and the link of the playlist, or (None, None) in case of error.
+        """
+        logger.info(f"playlist to publish: {playlist_name}")
+
+        # Verify if the user is authenticated
+        if not self.sp:
+            logger.error("Error: the user is not authenticated to create a playlist.")
+            return None, None
+
+        if playlist_id:
+            # Update the existing playlist
+            self.sp.playlist_change_details(playlist_id, **_playlist_details(playlist_name, playlist_description))
+            playlist = self.sp.playlist(playlist_id, fields=PLAYLIST_FIELDS)
+        else:
+            # Get the user profile
             user_profile = self.sp.me()
             logger.info(f"Authenticated user: {user_profile['display_name']}")
 
             # Create a new playlist
-            playlist = self.sp.user_playlist_create(user=user_profile['id'], name=playlist_name, public=True, description=playlist_description)
+            playlist = self.sp.user_playlist_create(user=user_profile['id'], public=True,
+                                                    **_playlist_details(playlist_name, playlist_description))
             playlist_id = playlist['id']
 
-            # Get the URIs of the songs (URI is required to add songs to a playlist)
-            track_uris = []
-            for song in songs:
-                # Search for the song on Spotify to get its URI
-                query = f"{song.name} {song.artist}"
-                result = self.sp.search(q=query, type='track', limit=1)
-
-                if result['tracks']['items']:
-                    track_uri = result['tracks']['items'][0]['uri']
-                    track_uris.append(track_uri)
-                else:
-                    logger.warning(f"Song not found: {song.name} by {song.artist} on Spotify.")
-
-            # Add the songs to the created playlist
-            if track_uris:
-                self.sp.playlist_add_items(playlist_id, track_uris)
-                logger.info(f"Playlist '{playlist_name}' created with {len(track_uris)} songs.")
-            else:
-                logger.warning(f"No songs were added to the playlist '{playlist_name}' because no valid URIs were found.")
+        # Replace the items of the playlist, so an existing playlist ends up with exactly these songs
+        track_uris = self._get_track_uris(songs)
+        if track_uris:
+            self.sp.playlist_replace_items(playlist_id, track_uris)
+            logger.info(f"Playlist '{playlist_name}' published with {len(track_uris)} songs.")
+        else:
+            logger.warning(f"No songs were added to the playlist '{playlist_name}' because no valid URIs were found.")
 
-            # Return the link to the created playlist
-            playlist_url = playlist['external_urls']['spotify']
-            return playlist_url
+        # Return the link to the playlist
+        playlist_url = playlist['external_urls']['spotify']
+        return playlist_id, playlist_url
+
+    def _get_track_uris(self, songs):
+        """
+        Gets the Spotify URIs of the songs (URI is required to add songs to a playlist).
+
+        Args:
+            songs (list): A list of Track objects.
+
+        Returns:
+            list: The URIs of the songs found on Spotify.
+        """
+        track_uris = []
+        for song in songs:
+            if song.track_id:
+                track_uris.append(_track_uri(song))
+                continue
+
+            # Search for the song on Spotify to get its URI
+            result = self.sp.search(**_song_search_params(song))
+            track_uris.append(_found_track_uri(result, song))
+        return [uri for uri in track_uris if uri]
+
+
+class AsyncSpotifyRockTracks:
+    """
+    Async client of the Spotify Web API, wrapping a SpotifyRockTracks. The network methods are coroutines
+    sending their requests through the shared async HTTP session, so many concurrent calls run on one event
+    loop and thread.
+
+    The wrapped SpotifyRockTracks provides the authentication (the access token is obtained and refreshed
+    by its spotipy auth manager), the configured genres and markets and the popularity histories. The
+    request parameters, parsing, deduplication and error handling are shared with it, so only the
+    transport differs: spotipy has no async API, and the sync client remains the one used by
+    publish_week and the job queue workers.
+
+    Each `async with` block holds the shared async HTTP session open, and the session is closed
+    when its last holder releases it.
+    """
+
+    def __init__(self, genres=None, markets=None, max_workers=MAX_WORKERS, history=None, spotify_rock_tracks=None):
+        """
+        Initializes an instance of AsyncSpotifyRockTracks.
+
+        Args:
+            genres (list): Genres to query. Ignored if spotify_rock_tracks is given. Default is DEFAULT_GENRES.
+            markets (list): Markets to query. Ignored if spotify_rock_tracks is given. Default is DEFAULT_MARKETS.
+            max_workers (int): Maximum number of concurrent requests of the wrapped client. Default is MAX_WORKERS.
+            history (GenreHistories): Optional histories. Ignored if spotify_rock_tracks is given.
+            spotify_rock_tracks (SpotifyRockTracks): The client to wrap. If None, a new one is created.
+        """
+        self.spotify_rock_tracks = spotify_rock_tracks or SpotifyRockTracks(genres=genres, markets=markets,
+                                                                            max_workers=max_workers, history=history)
+        self._token_info = None
+
+    @property
+    def sp(self):
+        return self.spotify_rock_tracks.sp
+
+    @property
+    def genres(self):
+        return self.spotify_rock_tracks.genres
+
+    @property
+    def markets(self):
+        return self.spotify_rock_tracks.markets
+
+    async def __aenter__(self):
+        acquire_session()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        # The session is shared with the other async clients, so it is only closed by its last holder
+        await release_session()
+
+    async def _access_token(self):
+        """
+        Returns a valid access token, refreshing it off the event loop when it expired.
+
+        Returns:
+            str: The access token.
+        """
+        auth_manager = self.sp.auth_manager
+        if auth_manager is None:
+            return self.sp._auth  # The static token of a replayed cassette
+        if self._token_info is None or auth_manager.is_token_expired(self._token_info):
+            token = await asyncio.to_thread(auth_manager.get_access_token, as_dict=False)
+            self._token_info = auth_manager.cache_handler.get_cached_token() or {'access_token': token, 'expires_at': 0}
+        return self._token_info['access_token']
+
+    async def _request(self, method, path, params=None, body=None):
+        """
+        Sends a request to the Spotify Web API, retrying when it is rate limited or fails with a server error.
+
+        Args:
+            method (str): The HTTP method.
+            path (str): The endpoint path, relative to SPOTIFY_API_URL.
+            params (dict): Query parameters. Parameters set to None are not sent.
+            body (dict): JSON body.
+
+        Returns:
+            dict: The JSON response, or None if the response has no content.
+
+        Raises:
+            spotipy.exceptions.SpotifyException: If the request fails.
+        """
+        if not self.sp:
+            raise spotipy.exceptions.SpotifyException(401, -1, "The user is not authenticated.")
+        params = {key: value for key, value in (params or {}).items() if value is not None}
+        url = SPOTIFY_API_URL + path
+        async with hold_session() as session:
+            for attempt in range(MAX_RETRIES + 1):
+                headers = {'Authorization': f'Bearer {await self._access_token()}'}
+                async with session.request(method, url, params=params, json=body, headers=headers) as response:
+                    content = await response.text()
+                if response.status < 400:
+                    return json.loads(content) if content else None
+                retry = response.status == 429 or response.status >= 500
+                if retry and attempt < MAX_RETRIES:
+                    delay = float(response.headers.get('Retry-After', 2 ** attempt * 0.3))
+                    logger.warning(f"Spotify returned {response.status} for {path}, retrying in {delay} seconds.")
+                    await asyncio.sleep(delay)
+                    continue
+                raise spotipy.exceptions.SpotifyException(response.status, -1, f"{url}: {content}",
+                                                          headers=dict(response.headers))
+
+    @handle_spotify_errors('retrieving playlists')
+    async def get_rock_playlists(self, limit=10, genre=None, market=None):
+        """Async version of `SpotifyRockTracks.get_rock_playlists`."""
+        genre = genre or self.genres[0]
+        playlists = await self._request('GET', 'search', _search_params(genre, 'playlist', limit, market))
+        logger.info(f"Retrieved {len(playlists['playlists']['items'])} {genre} playlists.")
+        return playlists['playlists']['items']
+
+    async def get_rock_tracks_week_year(self, limit=5, week_of_the_year=12, year=2024, genre=None, market=None):
+        """Async version of `SpotifyRockTracks.get_rock_tracks_week_year`."""
+        tracks = await self.search_rock_tracks_week_year(limit=limit, week_of_the_year=week_of_the_year, year=year,
+                                                         genre=genre, market=market)
+        return await self.describe_tracks(tracks, genre=genre)
+
+    @handle_spotify_errors('retrieving tracks', on_error=list)
+    async def search_rock_tracks_week_year(self, limit=5, week_of_the_year=12, year=2024, genre=None, market=None):
+        """Async version of `SpotifyRockTracks.search_rock_tracks_week_year`."""
+        genre = genre or self.genres[0]
+        params = _search_params(f'genre:"{genre}" year:{year}', 'track', limit, market)
+        logger.info(f"Spotify query: {params['q']} (market: {market})")
+        results = await self._request('GET', 'search', params)
+        tracks = tracks_from_search(results)
+
+        logger.info(f"Retrieved {len(tracks)} {genre} tracks from week {week_of_the_year} of {year}.")
+        self.spotify_rock_tracks._record_history(tracks, genre)
+        return tracks
+
+    async def describe_tracks(self, tracks, numbered=True, genre=None):
+        """Async version of `SpotifyRockTracks.describe_tracks`."""
+        genre = genre or self.genres[0]
+        descriptions = await asyncio.gather(*(aget_track_description(song, str(i) if numbered else None, genre)
+                                              for i, song in enumerate(tracks, start=1)))
+        for song, description in zip(tracks, descriptions):
+            song.description = description
+        return tracks
+
+    async def get_tracks_matrix(self, limit=5, week_of_the_year=12, year=2024, describe=True):
+        """Async version of `SpotifyRockTracks.get_tracks_matrix`."""
+        cells = [(genre, market) for genre in self.genres for market in self.markets]
+        cell_tracks = await asyncio.gather(*(
+            self.search_rock_tracks_week_year(limit=limit, week_of_the_year=week_of_the_year, year=year,
+                                              genre=genre, market=market)
+            for genre, market in cells))
+
+        unique_tracks, results = _deduplicate(cells, cell_tracks)
+
+        if describe:
+            await asyncio.gather(*(self.describe_tracks(tracks, numbered=False, genre=genre)
+                                   for genre, tracks in _group_by_genre(unique_tracks).items()))
+
+        logger.info(f"Retrieved {len(unique_tracks)} unique tracks across {len(cells)} genre/market cells.")
+        return results
+
+    @handle_spotify_errors('retrieving playlist tracks', on_error=list)
+    async def get_playlist_tracks(self, playlist_id, market=None):
+        """Async version of `SpotifyRockTracks.get_playlist_tracks`."""
+        playlist_tracks = await self._request('GET', f'playlists/{playlist_id}/tracks', {'market': market})
+        songs = tracks_from_playlist(playlist_tracks)
+        logger.info(f"Retrieved {len(songs)} tracks from playlist {playlist_id}.")
+        return songs
+
+    @handle_spotify_errors('retrieving top tracks', on_error=list)
+    async def get_top_rock_tracks(self, limit_playlists=5, genre=None, market=None):
+        """Async version of `SpotifyRockTracks.get_top_rock_tracks`."""
+        genre = genre or self.genres[0]
+        playlists = await self.get_rock_playlists(limit=limit_playlists, genre=genre, market=market)
+        playlist_songs = await asyncio.gather(*(self.get_playlist_tracks(playlist['id'], market=market)
+                                                for playlist in playlists))
+        top_songs = _by_popularity(playlist_songs)
+        logger.info(f"Retrieved a total of {len(top_songs)} songs.")
+        self.spotify_rock_tracks._record_history(top_songs, genre)
+        return top_songs
+
+    async def create_playlist(self, playlist_name, songs, playlist_description=""):
+        """Async version of `SpotifyRockTracks.create_playlist`."""
+        playlist_id, playlist_url = await self.publish_playlist(playlist_name, songs, playlist_description)
+        return playlist_url
+
+    @handle_spotify_errors('publishing the playlist', on_error=_no_playlist)
+    async def publish_playlist(self, playlist_name, songs, playlist_description="", playlist_id=None):
+        """Async version of `SpotifyRockTracks.publish_playlist`."""
+        logger.info(f"playlist to publish: {playlist_name}")
+
+        if not self.sp:
+            logger.error("Error: the user is not authenticated to create a playlist.")
+            return None, None
+
+        if playlist_id:
+            await self._request('PUT', f'playlists/{playlist_id}',
+                                body=_playlist_details(playlist_name, playlist_description))
+            playlist = await self._request('GET', f'playlists/{playlist_id}', {'fields': PLAYLIST_FIELDS})
+        else:
+            user_profile = await self._request('GET', 'me')
+            logger.info(f"Authenticated user: {user_profile['display_name']}")
+            body = dict(_playlist_details(playlist_name, playlist_description), public=True)
+            playlist = await self._request('POST', f"users/{user_profile['id']}/playlists", body=body)
+            playlist_id = playlist['id']
+
+        track_uris = await self._get_track_uris(songs)
+        if track_uris:
+            await self._request('PUT', f'playlists/{playlist_id}/tracks', body={'uris': track_uris})
+            logger.info(f"Playlist '{playlist_name}' published with {len(track_uris)} songs.")
+        else:
+            logger.warning(f"No songs were added to the playlist '{playlist_name}' because no valid URIs were found.")
+
+        return playlist_id, playlist['external_urls']['spotify']
+
+    async def _get_track_uris(self, songs):
+        """Async version of `SpotifyRockTracks._get_track_uris`, searching the songs without an ID concurrently."""
+        async def track_uri(song):
+            if song.track_id:
+                return _track_uri(song)
+            return _found_track_uri(await self._request('GET', 'search', _song_search_params(song)), song)
+
+        track_uris = await asyncio.gather(*(track_uri(song) for song in songs))
+        return [uri for uri in track_uris if uri]
 
-        except Exception as e:
-            logger.error(f"Error creating the playlist: {e}")
-            return None #in case of error, we don't want to return anything, to not block the program.
-        
 
 def get_today_week_of_year():
     """
@@ -328,73 +760,378 @@ def get_today_week_of_year():
     
     return result
 
-def get_track_description(track, position):
-    return get_openai_response(f"Can you write the introduction for this song: {track['name']} from {track['artists'][0]['name']}, as if you were the author of a rock music blog which present a list with the top rock songs,  the first thing that has to be mentioned is that this is the song number {position} in the list, You should omit the introduction from the response, I just want the text for the blog, and the response should be no more than 35 words.")
+def _search_params(query, search_type, limit, market=None):
+    """Builds the parameters of a Spotify search, sent by spotipy or as the query string of the async client."""
+    return {'q': query, 'type': search_type, 'limit': limit, 'market': market}
 
-# Main execution
-if __name__ == "__main__":
-    # Instantiate the SpotifyRockTracks class
-    spotify_rock_tracks = SpotifyRockTracks()
 
-    # Get the current week of the year
-    week_of_the_year = str(get_today_week_of_year())
+def _song_search_params(song):
+    """Builds the search of a song without a Spotify ID, by name and artist."""
+    return _search_params(f"{song.name} {song.artist}", 'track', 1)
 
-    # Retrieve top rock songs for the current week and year
-    top_songs = spotify_rock_tracks.get_rock_tracks_week_year(limit=5, week_of_the_year=week_of_the_year, year=2024)
-    
-    # Reverse the order of the list (optional, based on your logic)
-    top_songs.reverse()
 
-    # Define your Blogger blog ID
-    blog_id = '7624840374831160388'  # Replace with your actual blog ID
+def _playlist_details(playlist_name, playlist_description):
+    """Builds the name and description of a playlist, sent on creation and on update."""
+    return {'name': playlist_name, 'description': playlist_description}
+
+
+def _track_uri(song):
+    """Returns the Spotify URI of a track with a Spotify ID."""
+    return f"spotify:track:{song.track_id}"
 
-    # Generate a title for the blog post
-    title = f'Top Rock Songs for Week {week_of_the_year}'
 
-    # Generate an introduction for the blog post using OpenAI
-    introduction_text = get_openai_response(
-        "Can you write the introduction for a list with the top rock songs for this week as if you were the author of a rock music blog? "
-        "You should omit the introduction from the response. I just want the text for the blog, and the response should be no more than 35 words."
-    )
+def _found_track_uri(result, song):
+    """Returns the URI of the first result of a song search, or None if the song was not found."""
+    if result['tracks']['items']:
+        return result['tracks']['items'][0]['uri']
+    logger.warning(f"Song not found: {song.name} by {song.artist} on Spotify.")
+    return None
 
-    # Format the blog content in HTML
-    content = f'<p>{introduction_text}</p>'
-    content += spotify_rock_tracks.display_top_tracks_html(top_songs)
 
-    # Generate a text for audio description
-    text_for_audio = introduction_text + spotify_rock_tracks.display_top_tracks_text(top_songs)
+def tracks_from_search(results):
+    """
+    Builds the Track objects of a Spotify track search response.
 
-    # Create a Spotify playlist for the top rock songs of the current week
-    playlist_name = f"Top Rock Anthems for Week {week_of_the_year}"
-    playlist_description = f"Top rock anthems for week {week_of_the_year}"
-    playlist_url = spotify_rock_tracks.create_playlist(playlist_name, top_songs, playlist_description)
+    Args:
+        results (dict): The response of a track search.
+
+    Returns:
+        list: A list of Track objects.
+    """
+    return [
+        Track(
+            name=item['name'],
+            artist=item['artists'][0]['name'],
+            popularity=item['popularity'],
+            release_date=item['album']['release_date'],
+            track_id=item['id']
+        )
+        for item in results['tracks']['items']
+    ]
+
+
+def tracks_from_playlist(playlist_tracks):
+    """
+    Builds the Track objects of a Spotify playlist items response.
+
+    Args:
+        playlist_tracks (dict): The response of a playlist items request.
+
+    Returns:
+        list: A list of Track objects.
+    """
+    return [
+        Track(
+            name=item['track']['name'],
+            artist=item['track']['artists'][0]['name'],
+            popularity=item['track']['popularity'],
+            track_id=item['track']['id']
+        )
+        for item in playlist_tracks['items']
+    ]
+
+
+def _deduplicate(cells, cell_tracks):
+    """
+    Makes every cell reference one Track object per track ID.
+
+    Args:
+        cells (list): The (genre, market) cells.
+        cell_tracks (list): The tracks found for each cell.
+
+    Returns:
+        tuple: The unique tracks keyed by track ID, with the (genre, market) cell where each one was
+        first found, and the tracks of each cell keyed by cell.
+    """
+    unique_tracks = {}
+    results = {}
+    for cell, tracks in zip(cells, cell_tracks):
+        results[cell] = [unique_tracks.setdefault(song.track_id, (song, cell))[0] for song in tracks]
+    return unique_tracks, results
+
+
+def _group_by_genre(unique_tracks):
+    """Groups the unique tracks by the genre of the cell where they were first found."""
+    groups = {}
+    for song, (genre, market) in unique_tracks.values():
+        groups.setdefault(genre, []).append(song)
+    return groups
+
+
+def _by_popularity(playlist_songs):
+    """
+    Merges the tracks of several playlists, sorted from the most to the least popular.
+
+    Args:
+        playlist_songs (iterable): The lists of Track objects of each playlist.
+
+    Returns:
+        list: The Track objects of every playlist, sorted by popularity.
+    """
+    all_songs = [song for songs in playlist_songs for song in songs]
+    return sorted(all_songs, key=lambda x: x.popularity, reverse=True)
+
+
+def _track_description_prompt(track, position=None, genre='rock'):
+    position_text = f" the first thing that has to be mentioned is that this is the song number {position} in the list," if position else ""
+    return f"Can you write the introduction for this song: {track.name} from {track.artist}, as if you were the author of a {genre} music blog which present a list with the top {genre} songs,{position_text} You should omit the introduction from the response, I just want the text for the blog, and the response should be no more than 35 words."
+
+def get_track_description(track, position=None, genre='rock'):
+    return get_openai_response(_track_description_prompt(track, position, genre))
+
+async def aget_track_description(track, position=None, genre='rock'):
+    return await aget_openai_response(_track_description_prompt(track, position, genre))
+
+def is_generation_error(text):
+    """
+    Returns whether a generated text is the error message returned by `get_openai_response`.
+
+    Args:
+        text (str): The generated text.
+
+    Returns:
+        bool: True if the text is missing or an error message.
+    """
+    return not text or text.startswith('Error:')
+
+# Set to True to publish the post on Blogger
+PUBLISH_TO_BLOGGER = False
+
+# Defaults of the weekly run
+BLOG_ID = '7624840374831160388'  # Replace with your actual blog ID
+VOICE_ID = "CwhRBWXzGAHq8TQ4Fs17"  # Replace with your actual voice ID
+
+
+def publish_week(spotify_rock_tracks, publish_state, blog_id=BLOG_ID, genre=None, year=None, week_of_the_year=None,
+                 voice_id=VOICE_ID, output_dir='.'):
+    """
+    Runs the weekly flow for one blog and genre: retrieves the top songs, generates the texts, and
+    publishes the playlist, the blog post and the audio file.
+
+    The last published state is stored per blog, genre and week in `publish_state`. If the chart has
+    not changed since the last run, the generated texts are reused and every step that already
+    published the same content is skipped; otherwise the playlist and the post are updated in place.
+
+    Args:
+        spotify_rock_tracks (SpotifyRockTracks): The (shared) Spotify client.
+        publish_state (PublishState): The (shared) publish state.
+        blog_id (str): The Blogger blog to publish to.
+        genre (str): The genre. Default is the first genre of `spotify_rock_tracks`.
+        year (int): The ISO year. Default is the current ISO year.
+        week_of_the_year (int): The ISO week number. Default is the current week.
+        voice_id (str): The ElevenLabs voice of the audio file.
+        output_dir (str): Directory where the audio, Markdown and feed files are written.
+
+    Raises:
+        RuntimeError: If no songs are found for the week, or generating the introduction or a description fails.
+        Exception: If publishing the blog post or generating the audio file fails.
+    """
+    genre = genre or spotify_rock_tracks.genres[0]
+    if year is None or week_of_the_year is None:
+        # Default to the current ISO week, as the queued jobs do
+        iso_year, iso_week, _ = datetime.date.today().isocalendar()
+        year = year or iso_year
+        week_of_the_year = week_of_the_year or iso_week
+    week_of_the_year = str(week_of_the_year)
+
+    # Load what was last published for this blog, genre and week
+    key = week_key(blog_id, genre, year, week_of_the_year)
+    published = publish_state.get(key)
+
+    # Retrieve top songs for the week and year
+    top_songs = spotify_rock_tracks.search_rock_tracks_week_year(limit=5, week_of_the_year=week_of_the_year, year=year,
+                                                                 genre=genre)
+    if not top_songs:
+        # An empty chart means the search failed; publishing it would wipe the live playlist, post and audio
+        raise RuntimeError(f"No songs found for {key}, nothing was published.")
+    track_ids = [song.track_id for song in top_songs]
+
+    stored_texts = [published.get('introduction')] + published.get('descriptions', [])
+    if published.get('track_ids') == track_ids and not any(map(is_generation_error, stored_texts)):
+        # The chart has not changed: reuse the texts generated in the last run
+        logging.info(f"Chart for {key} is unchanged, reusing the generated texts.")
+        introduction_text = published['introduction']
+        for song, description in zip(top_songs, published['descriptions']):
+            song.description = description
+    else:
+        spotify_rock_tracks.describe_tracks(top_songs, genre=genre)
+
+        # Generate an introduction for the blog post using OpenAI
+        with stage('introduction'):
+            introduction_text = get_openai_response(
+                f"Can you write the introduction for a list with the top {genre} songs for this week as if you were the author of a {genre} music blog? "
+                "You should omit the introduction from the response. I just want the text for the blog, and the response should be no more than 35 words."
+            )
+
+    descriptions = [song.description for song in top_songs]
+    errors = [text for text in [introduction_text] + descriptions if is_generation_error(text)]
+    if errors:
+        # Fail the run instead of storing the error messages, so a retry generates the texts again
+        raise RuntimeError(f"Text generation failed for {key}: {errors[0]}")
+    digest = content_hash(track_ids, [introduction_text] + descriptions)
+    publish_state.update(key, track_ids=track_ids, introduction=introduction_text, descriptions=descriptions)
+
+    # Reverse the order of the list (optional, based on your logic)
+    top_songs.reverse()
+
+    # Generate a title for the blog post
+    title = f'Top {genre.title()} Songs for Week {week_of_the_year}'
+
+    # Create (or update in place) the Spotify playlist for the top songs of the week
+    playlist_url = published.get('playlist_url')
+    if published.get('playlist_hash') == digest:
+        logging.info(f"Playlist for {key} is unchanged, skipping update.")
+    else:
+        playlist_name = f"Top {genre.title()} Anthems for Week {week_of_the_year}"
+        playlist_description = f"Top {genre} anthems for week {week_of_the_year}"
+        playlist_id, playlist_url = spotify_rock_tracks.publish_playlist(
+            playlist_name, top_songs, playlist_description, playlist_id=published.get('playlist_id'))
+        if playlist_id:
+            publish_state.update(key, playlist_id=playlist_id, playlist_url=playlist_url, playlist_hash=digest)
+
+    # Render the blog content in HTML, the text for the audio description, Markdown and the feeds in one pass,
+    # once the playlist link is known
+    with stage('render'):
+        rendered = render_tracks(top_songs[:5], introduction=introduction_text, title=title, link=playlist_url or '')
+        content = rendered['html']
+        text_for_audio = rendered['text']
 
     # Add playlist link to the blog content
     content_footer = f'<p><span style="font-size: x-small;">This list has been created with AI using Spotify data and some magic. You can find the <a href="{playlist_url}">playlist here</a>.</span></p>'
     content += content_footer
+    # The post also embeds the playlist link, so it is compared by its final content
+    post_digest = content_hash(track_ids, [content])
+
+    # Write the Markdown and feed files, unless they already hold the same content
+    os.makedirs(output_dir, exist_ok=True)
+    feed_files = {os.path.join(output_dir, title + extension): output_format
+                  for extension, output_format in (('.md', 'markdown'), ('.rss.xml', 'rss'), ('.json', 'json'))}
+    if published.get('feed_hash') == post_digest and all(map(os.path.exists, feed_files)):
+        logging.info(f"Feed files for {key} are unchanged, skipping write.")
+    else:
+        for path, output_format in feed_files.items():
+            with open(path, 'w', encoding='utf-8') as output_file:
+                output_file.write(rendered[output_format])
+        publish_state.update(key, feed_hash=post_digest)
+
+    # Publish the blog post, or patch the one already published for this week
+    if published.get('post_hash') == post_digest:
+        logging.info(f"Blog post for {key} is unchanged, skipping publish.")
+    elif PUBLISH_TO_BLOGGER:
+        # Get credentials for Blogger API (loaded from token.json and refreshed only when expired)
+        creds = get_credentials()
+
+        # Create an instance of BlogPost with the blog ID, title, content, and credentials
+        with stage('publish_post'):
+            blog_post = BlogPost(blog_id, title, content, creds)
+            if published.get('post_id'):
+                post_id, post_url = blog_post.update_post(published['post_id'])
+            else:
+                post_id, post_url = blog_post.create_post()
+        publish_state.update(key, post_id=post_id, post_url=post_url, post_hash=post_digest)
 
-    # Get credentials for Blogger API
-    creds = get_credentials()
-
-    # Create an instance of BlogPost with the blog ID, title, content, and credentials
-    blog_post = BlogPost(blog_id, title, content, creds)
-    
-    # Publish the blog post
-    #blog_post.create_post()
-
-    # Print a confirmation message
-    logging.info(f"Blog post titled '{title}' was successfully published.")
+        # Print a confirmation message
+        logging.info(f"Blog post titled '{title}' was successfully published.")
 
-    voice_id = "CwhRBWXzGAHq8TQ4Fs17"  # Replace with your actual voice ID
-    output_filename = title+".mp3"
+    output_filename = os.path.join(output_dir, title + ".mp3")
     
     # Optionally, adjust stability and similarity_boost if needed
     stability = 0.8
     similarity_boost = 0.85
 
-    try:
-        # Call the text_to_speech function from tts_module
+    if published.get('audio_hash') == digest and os.path.exists(output_filename):
+        logging.info(f"Audio file {output_filename} is unchanged, skipping generation.")
+        return
+
+    # Call the text_to_speech function from tts_module
+    with stage('text_to_speech'):
         text_to_speech(text_for_audio, voice_id, output_filename, stability=stability, similarity_boost=similarity_boost)
-        print(f"Audio file generated: {output_filename}")
+    publish_state.update(key, audio_hash=digest)
+    logging.info(f"Audio file generated: {output_filename}")
+
+
+def main(data_dir='.'):
+    """
+    Runs the weekly flow for the default blog, genre and voice for the current week.
+
+    Args:
+        data_dir (str): Directory of the publish state, the popularity history and the output files.
+    """
+    # Instantiate the SpotifyRockTracks class, recording the popularity of the retrieved songs
+    spotify_rock_tracks = SpotifyRockTracks(history=GenreHistories(os.path.join(data_dir, HISTORY_DIR)))
+
+    try:
+        publish_week(spotify_rock_tracks, PublishState(os.path.join(data_dir, STATE_FILE)), output_dir=data_dir)
+    except CassetteMissError:
+        raise  # A replayed run must fail on an unrecorded request
     except Exception as e:
         print(f"An error occurred: {e}")
+
+
+def run_worker(queue_path=QUEUE_FILE, workers=4, until_empty=False, data_dir='.'):
+    """
+    Runs a pool of workers publishing the jobs of the queue. All the workers share one Spotify
+    client (with its connection pool and token cache), the popularity histories, one publish state and
+    the Blogger credentials; each worker thread reuses its own Blogger client.
+
+    Args:
+        queue_path (str): The SQLite file of the queue.
+        workers (int): Number of worker threads.
+        until_empty (bool): Whether to return once the queue is empty instead of waiting for new jobs.
+        data_dir (str): Directory of the publish state, the popularity history and the output files.
+    """
+    spotify_rock_tracks = SpotifyRockTracks(max_workers=max(MAX_WORKERS, workers),
+                                            history=GenreHistories(os.path.join(data_dir, HISTORY_DIR)))
+    publish_state = PublishState(os.path.join(data_dir, STATE_FILE))
+    queue = JobQueue(queue_path)
+
+    def handle(job):
+        publish_week(spotify_rock_tracks, publish_state, blog_id=job.blog_id, genre=job.genre, year=job.year,
+                     week_of_the_year=job.week, voice_id=job.voice_id, output_dir=os.path.join(data_dir, 'output', job.blog_id))
+
+    try:
+        WorkerPool(queue, handle, workers=workers).run(until_empty=until_empty)
+    finally:
+        queue.close()
+
+
+# Main execution
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Publishes the top rock songs of the week.")
+    parser.add_argument('--profile', nargs='?', const='profile', metavar='DIR',
+                        help="profile each stage and write the reports to DIR (default: profile)")
+    parser.add_argument('--enqueue', nargs=3, metavar=('BLOG_ID', 'GENRE', 'VOICE_ID'),
+                        help="queue a job for the current week instead of running the flow")
+    parser.add_argument('--rerun', action='store_true', help="with --enqueue, queue the week again even if it is done")
+    parser.add_argument('--worker', action='store_true', help="run a pool of workers publishing the queued jobs")
+    parser.add_argument('--workers', type=int, default=4, help="number of worker threads (default: 4)")
+    parser.add_argument('--until-empty', action='store_true', help="stop the workers once the queue is empty")
+    parser.add_argument('--queue', default=QUEUE_FILE, help=f"SQLite file of the job queue (default: {QUEUE_FILE})")
+    args = parser.parse_args()
+
+    if args.enqueue:
+        blog_id, genre, voice_id = args.enqueue
+        year, week_of_the_year, _ = datetime.date.today().isocalendar()
+        queue = JobQueue(args.queue)
+        queue.enqueue(blog_id, genre, year, week_of_the_year, voice_id, rerun_done=args.rerun)
+        queue.close()
+    else:
+        data_dir = '.'
+        if os.getenv('CASSETTE_MODE') == 'replay':
+            # A replayed run starts from an empty state, so it exercises every recorded step,
+            # and must not change the real state, history, queue and output files
+            data_dir = tempfile.mkdtemp(prefix='replay-')
+            if args.worker:
+                queue_copy = os.path.join(data_dir, QUEUE_FILE)
+                if os.path.exists(args.queue):
+                    with sqlite3.connect(args.queue) as source, sqlite3.connect(queue_copy) as copy:
+                        source.backup(copy)
+                args.queue = queue_copy
+            logger.info(f"Replaying with state and output files in {data_dir}")
+
+        # Set CASSETTE_MODE=record|replay to record or replay all the API traffic of the run
+        with cassette_from_env(), profile(args.profile, instrument=[SpotifyRockTracks]):
+            if args.worker:
+                run_worker(args.queue, workers=args.workers, until_empty=args.until_empty, data_dir=data_dir)
+            else:
+                main(data_dir)
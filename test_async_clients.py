@@ -0,0 +1,127 @@
+import os
+import asyncio
+
+os.environ.setdefault('OPENAI_API_KEY', 'test-key')
+
+import openai
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from async_http import get_session, hold_session
+from chatgpt_api import ResponseMetrics, aget_openai_response
+from spotify_rock_tracks import AsyncSpotifyRockTracks
+
+
+def make_stream(tokens, delay=0):
+    async def stream():
+        for token in tokens:
+            await asyncio.sleep(delay)
+            yield {'choices': [{'delta': {'content': token}}]}
+    return stream()
+
+
+# Test that a slow attempt is hedged and the fastest response wins
+def test_aget_openai_response_hedges(mocker):
+    responses = [make_stream(['slow'], delay=1), make_stream(['fast', ' answer'])]
+    mocker.patch('openai.ChatCompletion.acreate', side_effect=lambda **kwargs: responses.pop(0))
+    metrics = ResponseMetrics()
+
+    response = asyncio.run(aget_openai_response('Hello', temperature=0.5, hedge_after=0.05, metrics=metrics))
+
+    assert response == 'fast answer'
+    assert metrics.hedged is True
+    assert metrics.winning_attempt == 1
+
+
+# Test that API errors are returned as error messages, like the sync version
+def test_aget_openai_response_error(mocker):
+    mocker.patch('openai.ChatCompletion.acreate', side_effect=openai.error.RateLimitError('Too many requests'))
+
+    response = asyncio.run(aget_openai_response('Hello', hedge_after=None))
+
+    assert response == 'Error: Rate limit exceeded, please try again later.'
+
+
+# Test that the playlists are fetched concurrently and their tracks sorted by popularity
+def test_async_get_top_rock_tracks(mocker):
+    def playlist_items(*tracks):
+        return {'items': [{'track': {'name': name, 'artists': [{'name': 'Artist'}], 'popularity': popularity, 'id': name}}
+                          for name, popularity in tracks]}
+
+    responses = {
+        'search': {'playlists': {'items': [{'id': 'a'}, {'id': 'b'}]}},
+        'playlists/a/tracks': playlist_items(('Song 1', 50), ('Song 2', 90)),
+        'playlists/b/tracks': playlist_items(('Song 3', 70)),
+    }
+
+    async def request(method, path, params=None, body=None):
+        return responses[path]
+
+    spotify_rock_tracks = AsyncSpotifyRockTracks()
+    mocker.patch.object(spotify_rock_tracks, '_request', side_effect=request)
+
+    top_songs = asyncio.run(spotify_rock_tracks.get_top_rock_tracks(limit_playlists=2))
+
+    assert [song.name for song in top_songs] == ['Song 2', 'Song 3', 'Song 1']
+
+
+# Test that the requests are authorized, rate limited requests retried and errors handled, through a local server
+def test_async_request(mocker):
+    received = []
+
+    async def search(request):
+        received.append((request.headers['Authorization'], dict(request.query)))
+        if len(received) == 1:
+            return web.Response(status=429, headers={'Retry-After': '0'})
+        return web.json_response({'tracks': {'items': [{'name': 'Song', 'artists': [{'name': 'Artist'}],
+                                                        'popularity': 80, 'album': {'release_date': '2024-05-01'},
+                                                        'id': 'a'}]}})
+
+    async def replace_items(request):
+        received.append(await request.json())
+        return web.Response(status=201)
+
+    async def not_found(request):
+        return web.Response(status=404, text='Not found')
+
+    app = web.Application()
+    app.router.add_get('/search', search)
+    app.router.add_put('/playlists/a/tracks', replace_items)
+    app.router.add_get('/playlists/b/tracks', not_found)
+
+    spotify_rock_tracks = AsyncSpotifyRockTracks(spotify_rock_tracks=mocker.Mock(genres=['rock'], markets=['US']))
+    mocker.patch.object(spotify_rock_tracks, '_access_token', return_value='token')
+
+    async def run():
+        async with TestServer(app) as server:
+            mocker.patch('spotify_rock_tracks.SPOTIFY_API_URL', str(server.make_url('/')))
+            async with spotify_rock_tracks:
+                return (await spotify_rock_tracks.search_rock_tracks_week_year(year=2024, market='US'),
+                        await spotify_rock_tracks._request('PUT', 'playlists/a/tracks', body={'uris': ['spotify:track:a']}),
+                        await spotify_rock_tracks.get_playlist_tracks('b'))
+
+    tracks, replaced, missing = asyncio.run(run())
+
+    assert [(song.name, song.popularity, song.track_id) for song in tracks] == [('Song', 80, 'a')]
+    assert received[:2] == [('Bearer token', {'q': 'genre:"rock" year:2024', 'type': 'track', 'limit': '5',
+                                              'market': 'US'})] * 2
+    assert received[2] == {'uris': ['spotify:track:a']}
+    assert replaced is None
+    assert missing == []
+
+
+# Test that leaving a client block does not close the session used by other clients and requests
+def test_shared_session_is_closed_by_its_last_holder(mocker):
+    spotify = mocker.Mock(genres=['rock'], markets=['US'])
+
+    async def run():
+        async with AsyncSpotifyRockTracks(spotify_rock_tracks=spotify):
+            session = get_session()
+            async with hold_session():  # A request in flight in another client
+                async with AsyncSpotifyRockTracks(spotify_rock_tracks=spotify):
+                    pass
+                assert not session.closed
+            assert not session.closed
+        return session
+
+    assert asyncio.run(run()).closed
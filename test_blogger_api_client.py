@@ -0,0 +1,40 @@
+import pytest
+
+from blogger_api_client import BlogPost, get_credentials
+
+
+# Test that an existing post is patched with the new title and content
+def test_update_post(mocker):
+    build = mocker.patch('blogger_api_client.build')
+    posts = build.return_value.posts.return_value
+    posts.patch.return_value.execute.return_value = {'id': 'post', 'url': 'https://blog/post'}
+
+    blog_post = BlogPost('blog', 'New title', '<p>New content</p>', creds=mocker.Mock())
+
+    assert blog_post.update_post('post') == ('post', 'https://blog/post')
+    posts.patch.assert_called_once_with(blogId='blog', postId='post',
+                                        body={'title': 'New title', 'content': '<p>New content</p>'})
+
+
+# Test that a post without content is not sent
+def test_update_post_empty_content(mocker):
+    build = mocker.patch('blogger_api_client.build')
+
+    with pytest.raises(ValueError):
+        BlogPost('blog', 'Title', ' ', creds=mocker.Mock()).update_post('post')
+
+    build.return_value.posts.assert_not_called()
+
+
+# Test that the credentials are loaded once and the client is built once per thread
+def test_credentials_and_client_are_shared(mocker):
+    mocker.patch('blogger_api_client._credentials', None)
+    load = mocker.patch('blogger_api_client._load_credentials', return_value=mocker.Mock(valid=True))
+    build = mocker.patch('blogger_api_client.build')
+
+    first = BlogPost('blog', 'Title', 'Content', get_credentials())
+    second = BlogPost('blog', 'Title', 'Content', get_credentials())
+
+    load.assert_called_once()
+    build.assert_called_once()
+    assert first.service is second.service
@@ -0,0 +1,188 @@
+import random
+import asyncio
+
+import pytest
+import aiohttp
+import httplib2
+import requests
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from cassette import CassetteMissError, normalize_request, use_cassette
+
+
+def make_response(request, status=200, content=b'{"ok": true}'):
+    response = requests.Response()
+    response.status_code = status
+    response.headers['Content-Type'] = 'application/json'
+    response._content = content
+    response.request = request
+    response.url = request.url
+    return response
+
+
+# Test that volatile fields and parameter order do not change the key
+def test_normalize_request_ignores_order_and_volatile_fields():
+    first = normalize_request('post', 'https://api.example.com/v1?b=2&a=1', b'{"model": "m", "temperature": 0.1}')
+    second = normalize_request('POST', 'https://API.example.com/v1?a=1&b=2', '{"temperature": 0.9, "model": "m"}')
+
+    assert first == second
+
+
+# Test that a recorded requests response is replayed without network
+def test_record_and_replay_requests(mocker, tmp_path):
+    path = str(tmp_path / 'run.cassette')
+    send = mocker.patch('cassette._original_adapter_send',
+                        side_effect=lambda adapter, request, **kwargs: make_response(request))
+
+    with use_cassette(path, mode='record'):
+        assert requests.get('https://api.example.com/tracks?q=rock').json() == {'ok': True}
+    send.assert_called_once()
+
+    send.reset_mock()
+    with use_cassette(path, mode='replay'):
+        response = requests.get('https://api.example.com/tracks?q=rock')
+    send.assert_not_called()
+    assert response.status_code == 200
+    assert response.json() == {'ok': True}
+
+
+# Test that repeated identical requests replay in recorded order
+def test_replay_repeated_requests_in_order(mocker, tmp_path):
+    path = str(tmp_path / 'run.cassette')
+    contents = iter([b'first', b'second'])
+    mocker.patch('cassette._original_adapter_send',
+                 side_effect=lambda adapter, request, **kwargs: make_response(request, content=next(contents)))
+
+    with use_cassette(path, mode='record'):
+        requests.get('https://api.example.com/me')
+        requests.get('https://api.example.com/me')
+
+    with use_cassette(path, mode='replay'):
+        bodies = [requests.get('https://api.example.com/me').content for _ in range(3)]
+
+    assert bodies == [b'first', b'second', b'second']
+
+
+# Test that a recorded httplib2 response (googleapiclient) is replayed
+def test_record_and_replay_httplib2(mocker, tmp_path):
+    path = str(tmp_path / 'run.cassette')
+    mocker.patch('cassette._original_http_request',
+                 return_value=(httplib2.Response({'status': '200', 'content-type': 'application/json'}), b'{"id": "1"}'))
+
+    with use_cassette(path, mode='record'):
+        httplib2.Http().request('https://www.googleapis.com/blogger/v3/blogs/1/posts', 'POST', body='{}')
+
+    with use_cassette(path, mode='replay'):
+        response, content = httplib2.Http().request('https://www.googleapis.com/blogger/v3/blogs/1/posts', 'POST', body='{}')
+
+    assert response.status == 200
+    assert content == b'{"id": "1"}'
+
+
+# Test that an unrecorded request fails in replay mode and the transports are restored
+def test_replay_miss(mocker, tmp_path):
+    original_send = requests.adapters.HTTPAdapter.send
+    path = str(tmp_path / 'run.cassette')
+    mocker.patch('cassette._original_adapter_send',
+                 side_effect=lambda adapter, request, **kwargs: make_response(request))
+
+    with use_cassette(path, mode='record'):
+        requests.get('https://api.example.com/me')
+
+    with pytest.raises(CassetteMissError):
+        with use_cassette(path, mode='replay'):
+            requests.get('https://api.example.com/other')
+
+    assert requests.adapters.HTTPAdapter.send is original_send
+
+
+# Test that aiohttp responses (async wrappers and openai) are recorded and replayed, line by line when streamed
+def test_record_and_replay_aiohttp(tmp_path):
+    path = str(tmp_path / 'run.cassette')
+    calls = []
+
+    async def handler(request):
+        calls.append(await request.json())
+        return web.Response(body=b'data: one\n\ndata: two\n\n', content_type='text/event-stream')
+
+    async def fetch(url):
+        async with aiohttp.ClientSession() as session:
+            async with session.post(url, params={'q': 'rock'}, json={'model': 'm', 'temperature': random.random()}) as response:
+                return response.status, [line async for line in response.content]
+
+    async def record():
+        app = web.Application()
+        app.router.add_post('/v1/chat', handler)
+        async with TestServer(app) as server:
+            url = str(server.make_url('/v1/chat'))
+            with use_cassette(path, mode='record'):
+                return url, await fetch(url)
+
+    url, recorded = asyncio.run(record())
+    with use_cassette(path, mode='replay'):
+        replayed = asyncio.run(fetch(url))
+
+    assert len(calls) == 1
+    assert recorded == replayed == (200, [b'data: one\n', b'\n', b'data: two\n', b'\n'])
+
+
+# Test that token fields are scrubbed from the recorded responses
+def test_record_scrubs_tokens(mocker, tmp_path):
+    path = str(tmp_path / 'run.cassette')
+    body = b'{"access_token": "secret", "refresh_token": "other", "expires_in": 3600}'
+    mocker.patch('cassette._original_adapter_send',
+                 side_effect=lambda adapter, request, **kwargs: make_response(request, content=body))
+
+    with use_cassette(path, mode='record'):
+        requests.post('https://accounts.example.com/api/token', data={'grant_type': 'refresh_token'})
+
+    with use_cassette(path, mode='replay'):
+        token = requests.post('https://accounts.example.com/api/token', data={'grant_type': 'refresh_token'}).json()
+    assert token == {'access_token': '<scrubbed>', 'refresh_token': '<scrubbed>', 'expires_in': 3600}
+
+
+# Test that a replay authenticates with static tokens and never loads the stored credentials
+def test_replay_uses_static_tokens(mocker, monkeypatch, tmp_path):
+    monkeypatch.setenv('OPENAI_API_KEY', 'test-key')
+    import blogger_api_client
+    import spotify_rock_tracks
+    from cassette import REPLAY_TOKEN, replaying
+
+    load = mocker.patch('blogger_api_client._load_credentials')
+    oauth = mocker.patch('spotify_rock_tracks.SpotifyOAuth')
+    path = str(tmp_path / 'run.cassette')
+    with use_cassette(path, mode='record'):
+        pass
+
+    with use_cassette(path, mode='replay'):
+        assert replaying()
+        sp = spotify_rock_tracks.authenticate_spotify()
+        credentials = blogger_api_client.get_credentials()
+    assert not replaying()
+
+    assert sp.auth_manager is None and sp._auth == REPLAY_TOKEN
+    assert credentials.token == REPLAY_TOKEN and credentials.valid
+    oauth.assert_not_called()
+    load.assert_not_called()
+
+
+# Test that a cassette miss is raised through the error handlers of the Spotify and OpenAI clients
+def test_cassette_miss_propagates(monkeypatch, tmp_path):
+    monkeypatch.setenv('OPENAI_API_KEY', 'test-key')
+    import chatgpt_api
+    from spotify_rock_tracks import handle_spotify_errors
+
+    @handle_spotify_errors("fetching tracks", on_error=list)
+    def fetch():
+        return requests.get('https://api.spotify.com/v1/search?q=rock').json()
+
+    path = str(tmp_path / 'run.cassette')
+    with use_cassette(path, mode='record'):
+        pass
+
+    with use_cassette(path, mode='replay'):
+        with pytest.raises(CassetteMissError):
+            fetch()
+        with pytest.raises(CassetteMissError):
+            chatgpt_api.get_openai_response("Describe rock")
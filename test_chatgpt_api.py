@@ -0,0 +1,99 @@
+import os
+import time
+
+os.environ.setdefault('OPENAI_API_KEY', 'test-key')
+
+import openai
+import pytest
+
+import chatgpt_api
+from chatgpt_api import ResponseMetrics, get_openai_response, stream_openai_response
+
+
+def make_stream(tokens, delay=0.0, error=None, stall=0.0):
+    def stream():
+        time.sleep(delay)
+        if error is not None:
+            raise error
+        for token in tokens:
+            yield {'choices': [{'delta': {'content': token}}]}
+            time.sleep(0.01)
+        time.sleep(stall)
+    return stream()
+
+
+def mock_create(mocker, *streams):
+    streams = list(streams)
+    return mocker.patch('openai.ChatCompletion.create', side_effect=lambda **kwargs: streams.pop(0))
+
+
+# Test that a slow original request is hedged and the hedge is streamed
+def test_hedge_wins(mocker):
+    mock_create(mocker, make_stream(['slow'], delay=1), make_stream(['fast', ' answer']))
+    metrics = ResponseMetrics()
+
+    tokens = list(stream_openai_response('Hello', temperature=0.5, timeout=5, hedge_after=0.05, metrics=metrics))
+
+    assert tokens == ['fast', ' answer']
+    assert metrics.hedged is True
+    assert metrics.winning_attempt == 1
+    assert metrics.time_to_first_token is not None
+
+
+# Test that an original request stalling after its first token is rescued by the hedge
+def test_stalled_stream_is_hedged(mocker):
+    mock_create(mocker, make_stream(['stalled'], stall=1), make_stream(['fast', ' answer'], delay=0.1))
+    metrics = ResponseMetrics()
+
+    response = get_openai_response('Hello', temperature=0.5, timeout=5, hedge_after=0.05, metrics=metrics)
+
+    assert response == 'fast answer'
+    assert metrics.hedged is True
+    assert metrics.winning_attempt == 1
+    assert metrics.total_latency < 1
+
+
+# Test that tokens are streamed as they arrive when hedging is disabled
+def test_stream_without_hedging(mocker):
+    mock_create(mocker, make_stream(['first'], stall=1))
+    metrics = ResponseMetrics()
+
+    stream = stream_openai_response('Hello', temperature=0.5, timeout=5, hedge_after=None, metrics=metrics)
+
+    assert next(stream) == 'first'
+    assert metrics.time_to_first_token < 1
+    stream.close()
+
+
+# Test that a failing original request falls back to the hedge
+def test_original_fails_hedge_succeeds(mocker):
+    mock_create(mocker, make_stream([], delay=0.1, error=openai.error.APIError('Server error')),
+                make_stream(['ok'], delay=0.2))
+    metrics = ResponseMetrics()
+
+    tokens = list(stream_openai_response('Hello', temperature=0.5, timeout=5, hedge_after=0.05, metrics=metrics))
+
+    assert tokens == ['ok']
+    assert metrics.winning_attempt == 1
+
+
+# Test that a request without a complete response before the deadline raises TimeoutError
+def test_deadline(mocker):
+    mock_create(mocker, make_stream(['late'], delay=1))
+
+    with pytest.raises(TimeoutError):
+        list(stream_openai_response('Hello', temperature=0.5, timeout=0.1, hedge_after=None))
+
+
+# Test that closing the stream cancels both attempts
+def test_close_cancels_attempts(mocker):
+    mock_create(mocker, make_stream(['slow'], delay=1), make_stream(['first', 'second', 'third']))
+    attempt = mocker.spy(chatgpt_api, '_stream_attempt')
+
+    stream = stream_openai_response('Hello', temperature=0.5, timeout=5, hedge_after=0.05)
+    assert next(stream) == 'first'
+    stream.close()
+
+    cancelled = [call.args[3] for call in attempt.call_args_list]
+    assert len(cancelled) == 2
+    assert all(event.is_set() for event in cancelled)
@@ -0,0 +1,103 @@
+import job_queue
+from job_queue import JobQueue, WorkerPool
+
+
+# Test that a job is queued once and leased by a single worker
+def test_enqueue_and_lease(tmp_path):
+    queue = JobQueue(str(tmp_path / 'jobs.sqlite3'))
+
+    assert queue.enqueue('blog', 'rock', 2024, 21, 'voice') is True
+    assert queue.enqueue('blog', 'rock', 2024, 21, 'voice') is False
+
+    job = queue.lease('worker-0')
+    assert (job.blog_id, job.genre, job.year, job.week, job.voice_id, job.attempts) == ('blog', 'rock', 2024, 21, 'voice', 1)
+    assert queue.lease('worker-1') is None
+    assert queue.depth() == 1
+
+    queue.complete(job)
+    assert queue.counts()['done'] == 1
+    assert queue.depth() == 0
+
+
+# Test that a failed job is queued again and a done job only on request
+def test_enqueue_again(mocker, tmp_path):
+    queue = JobQueue(str(tmp_path / 'jobs.sqlite3'))
+    queue.enqueue('blog', 'rock', 2024, 21, 'voice', max_attempts=1)
+    queue.fail(queue.lease('worker-0'), 'Error')
+    assert queue.counts()['failed'] == 1
+
+    assert queue.enqueue('blog', 'rock', 2024, 21, 'voice') is True
+    job = queue.lease('worker-0')
+    assert job.attempts == 1
+    queue.complete(job)
+
+    warning = mocker.spy(job_queue.logger, 'warning')
+    assert queue.enqueue('blog', 'rock', 2024, 21, 'voice') is False
+    warning.assert_called_once()
+    assert queue.enqueue('blog', 'rock', 2024, 21, 'voice', rerun_done=True) is True
+    assert queue.counts()['queued'] == 1
+
+
+# Test that an expired lease makes the job available again
+def test_expired_lease(tmp_path):
+    queue = JobQueue(str(tmp_path / 'jobs.sqlite3'))
+    queue.enqueue('blog', 'rock', 2024, 21, 'voice')
+
+    first = queue.lease('worker-0', lease_seconds=0)
+    second = queue.lease('worker-1')
+
+    assert second.id == first.id
+    assert second.attempts == 2
+
+
+# Test that failed jobs are retried until their maximum attempts
+def test_retries(mocker, tmp_path):
+    mocker.patch('job_queue.RETRY_DELAY', 0)
+    queue = JobQueue(str(tmp_path / 'jobs.sqlite3'))
+    queue.enqueue('blog', 'rock', 2024, 21, 'voice', max_attempts=2)
+
+    queue.fail(queue.lease('worker-0'), 'Error 1')
+    assert queue.counts()['queued'] == 1
+
+    queue.fail(queue.lease('worker-0'), 'Error 2')
+    assert queue.counts()['failed'] == 1
+    assert queue.lease('worker-0') is None
+
+
+# Test that the pool runs every job with the shared handler and reports its stats
+def test_worker_pool(mocker, tmp_path):
+    mocker.patch('job_queue.RETRY_DELAY', 0)
+    queue = JobQueue(str(tmp_path / 'jobs.sqlite3'))
+    for week in range(1, 6):
+        queue.enqueue('blog', 'rock', 2024, week, 'voice')
+    attempts = {}
+
+    def handler(job):
+        attempts[job.week] = attempts.get(job.week, 0) + 1
+        if job.week == 3 and attempts[job.week] == 1:
+            raise RuntimeError('Temporary error')
+
+    pool = WorkerPool(queue, handler, workers=3, poll_interval=0.01)
+    pool.run(until_empty=True)
+
+    stats = pool.stats()
+    assert queue.counts()['done'] == 5
+    assert attempts[3] == 2
+    assert (stats['queue_depth'], stats['completed'], stats['failed']) == (0, 5, 1)
+
+
+# Test that a worker whose lease expired cannot complete or fail the job leased again
+def test_stale_lease_is_dropped(tmp_path):
+    queue = JobQueue(str(tmp_path / 'jobs.sqlite3'))
+    queue.enqueue('blog', 'rock', 2024, 21, 'voice')
+
+    stale = queue.lease('worker-0', lease_seconds=0)
+    current = queue.lease('worker-1')
+
+    assert queue.complete(stale) is False
+    assert queue.fail(stale, 'Late error') is False
+    assert queue.counts()['leased'] == 1
+
+    assert queue.complete(current) is True
+    assert queue.fail(current, 'Late error') is False
+    assert queue.counts()['done'] == 1
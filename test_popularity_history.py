@@ -0,0 +1,63 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from popularity_history import GenreHistories, PopularityHistory, week_column
+
+
+def make_tracks(**popularity):
+    return [SimpleNamespace(track_id=track_id, popularity=value) for track_id, value in popularity.items()]
+
+
+# Test that recorded weeks are persisted and reloaded
+def test_record_and_reload(tmp_path):
+    history = PopularityHistory(str(tmp_path))
+    history.record(make_tracks(a=50, b=70), 2024, 20)
+
+    reloaded = PopularityHistory(str(tmp_path))
+
+    assert reloaded.track_ids == ['a', 'b']
+    assert reloaded.popularity(2024, 20).tolist() == [50, 70]
+    assert np.isnan(reloaded.popularity(2024, 21)).all()
+
+
+# Test the week-over-week queries
+def test_week_over_week_queries(tmp_path):
+    history = PopularityHistory(str(tmp_path))
+    history.record(make_tracks(a=50, b=70, c=60), 2024, 20)
+    history.record(make_tracks(a=80, b=65, d=90), 2024, 21)
+
+    assert history.biggest_climbers(2024, 21) == [('a', 30)]
+    assert history.new_entries(2024, 21) == ['d']
+    assert history.rank_changes(2024, 21)[0] == 1  # 'a' went from 3rd to 2nd
+    assert history.rolling_average(2024, 21, window=2).tolist()[:3] == [65, 67.5, 60]
+
+
+# Test that the matrix grows past its initial capacity and keeps the data
+def test_growth(mocker, tmp_path):
+    mocker.patch('popularity_history.MIN_TRACKS', 2)
+    history = PopularityHistory(str(tmp_path))
+    history.record(make_tracks(a=10, b=20), 2024, 1)
+    history.record(make_tracks(c=30), 2025, 30)
+
+    assert history.popularity(2024, 1).tolist()[:2] == [10, 20]
+    assert history.popularity(2025, 30)[2] == 30
+    assert history.new_entries(2025, 30) == ['c']
+
+
+# Test that weeks before the start of the history are rejected
+def test_week_before_epoch():
+    with pytest.raises(ValueError):
+        week_column(2023, 52)
+
+
+# Test that each genre has its own history, so the charts of other genres do not change its queries
+def test_genre_histories(tmp_path):
+    histories = GenreHistories(str(tmp_path))
+    histories.get('rock').record(make_tracks(a=50), 2024, 21)
+    histories.get('hard/rock').record(make_tracks(b=90), 2024, 21)
+
+    assert histories.get('rock') is histories.get('rock')
+    assert GenreHistories(str(tmp_path)).get('rock').new_entries(2024, 21) == ['a']
+    assert histories.get('hard/rock').track_ids == ['b']
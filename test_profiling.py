@@ -0,0 +1,66 @@
+import os
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import profiling
+from profiling import in_current_stage, profile, stage
+
+
+def allocate():
+    return [bytearray(1024) for _ in range(256)]
+
+
+# Test that nested stages are reported under their parent and the reports are written
+def test_nested_stages(tmp_path):
+    output_dir = str(tmp_path / 'profile')
+
+    with profile(output_dir) as profiler:
+        with stage('fetch'):
+            data = allocate()
+            with stage('render'):
+                data += allocate()
+
+    assert set(profiler.stages) == {'main', 'main/fetch', 'main/fetch/render'}
+    assert profiler.stages['main/fetch/render'].calls == 1
+    assert profiler.stages['main/fetch'].wall_time >= profiler.stages['main/fetch/render'].wall_time
+    assert profiler.stages['main/fetch'].peak_memory >= profiler.stages['main/fetch/render'].peak_memory
+    assert set(os.listdir(output_dir)) >= {'summary.txt', 'stacks.collapsed', 'main__fetch.prof', 'main__fetch__render.prof'}
+
+    with open(os.path.join(output_dir, 'summary.txt')) as summary:
+        report = summary.read()
+    assert 'main/fetch/render' in report
+    assert 'test_profiling.py' in report
+    assert 'tracemalloc.py' not in report
+
+
+def encode_for(seconds):
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        json.dumps({'track': list(range(100))})
+    with stage('nested'):
+        pass
+
+
+# Test that work run in executor threads is sampled and profiled under the stage that started it
+def test_executor_tasks_in_stage(tmp_path):
+    output_dir = str(tmp_path / 'profile')
+
+    with profile(output_dir) as profiler:
+        with stage('describe'):
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                list(executor.map(in_current_stage(encode_for), [0.2, 0.2]))
+
+    with open(os.path.join(output_dir, 'stacks.collapsed')) as collapsed:
+        samples = [line for line in collapsed if line.startswith('main;describe;') and 'encode_for' in line]
+    assert samples
+    functions = {function for _, _, function in profiler.stages['main/describe'].stats.stats}
+    assert {'encode_for', 'dumps'} <= functions
+    assert profiler.stages['main/describe/nested'].calls == 2
+
+
+# Test that stages do nothing when profiling is off
+def test_stage_without_profiler():
+    assert profiling._active is None
+    with stage('noop') as block:
+        assert block is None
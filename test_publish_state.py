@@ -0,0 +1,145 @@
+import os
+
+os.environ.setdefault('OPENAI_API_KEY', 'test-key')
+
+import pytest
+
+from publish_state import PublishState
+from spotify_rock_tracks import Track, publish_week
+
+
+class FakeSpotify:
+    genres = ['rock']
+
+    def __init__(self, track_ids, playlist_result=('playlist', 'https://open.spotify.com/playlist/1')):
+        self.track_ids = track_ids
+        self.playlist_result = playlist_result
+        self.published_playlists = []
+
+    def search_rock_tracks_week_year(self, **kwargs):
+        return [Track(f'Song {track_id}', 'Artist', 50, '2024-05-01', track_id=track_id) for track_id in self.track_ids]
+
+    def describe_tracks(self, tracks, **kwargs):
+        for song in tracks:
+            song.description = f'About {song.name}.'
+        return tracks
+
+    def publish_playlist(self, name, songs, description, playlist_id=None):
+        self.published_playlists.append(playlist_id)
+        return self.playlist_result
+
+
+@pytest.fixture
+def services(mocker):
+    mocker.patch('spotify_rock_tracks.PUBLISH_TO_BLOGGER', True)
+    mocker.patch('spotify_rock_tracks.get_credentials')
+    openai = mocker.patch('spotify_rock_tracks.get_openai_response', return_value='Intro.')
+    blog_post = mocker.patch('spotify_rock_tracks.BlogPost')
+    blog_post.return_value.create_post.return_value = ('post', 'https://blog/post')
+    blog_post.return_value.update_post.return_value = ('post', 'https://blog/post')
+
+    def text_to_speech(text, voice_id, output_filename, **kwargs):
+        with open(output_filename, 'wb') as audio:
+            audio.write(b'mp3')
+    tts = mocker.patch('spotify_rock_tracks.text_to_speech', side_effect=text_to_speech)
+    return openai, blog_post, tts
+
+
+def run(spotify, state, tmp_path):
+    publish_week(spotify, state, blog_id='blog', year=2024, week_of_the_year=21, output_dir=str(tmp_path))
+
+
+# Test that the state of a week is stored on disk
+def test_state_persists(tmp_path):
+    path = str(tmp_path / 'state.json')
+    PublishState(path).update('blog/rock/2024-W21', playlist_id='playlist')
+
+    assert PublishState(path).get('blog/rock/2024-W21') == {'playlist_id': 'playlist'}
+
+
+# Test that a rerun with the same chart skips every step
+def test_unchanged_chart_is_skipped(services, tmp_path):
+    openai, blog_post, tts = services
+    state = PublishState(str(tmp_path / 'state.json'))
+    spotify = FakeSpotify(['a', 'b'])
+
+    run(spotify, state, tmp_path)
+    run(spotify, state, tmp_path)
+
+    assert openai.call_count == 1
+    assert spotify.published_playlists == [None]
+    blog_post.return_value.create_post.assert_called_once()
+    blog_post.return_value.update_post.assert_not_called()
+    tts.assert_called_once()
+
+
+# Test that a changed chart updates the playlist and the post in place
+def test_changed_chart_updates_in_place(services, tmp_path):
+    openai, blog_post, tts = services
+    state = PublishState(str(tmp_path / 'state.json'))
+
+    run(FakeSpotify(['a', 'b']), state, tmp_path)
+    spotify = FakeSpotify(['b', 'c'])
+    run(spotify, state, tmp_path)
+
+    assert spotify.published_playlists == ['playlist']
+    blog_post.return_value.update_post.assert_called_once_with('post')
+    assert tts.call_count == 2
+
+
+# Test that the post is updated once a failed playlist is published
+def test_post_updated_after_playlist_failure(services, tmp_path):
+    openai, blog_post, tts = services
+    state = PublishState(str(tmp_path / 'state.json'))
+
+    run(FakeSpotify(['a'], playlist_result=(None, None)), state, tmp_path)
+    run(FakeSpotify(['a']), state, tmp_path)
+
+    blog_post.return_value.update_post.assert_called_once_with('post')
+    content = blog_post.call_args.args[2]
+    assert 'href="https://open.spotify.com/playlist/1"' in content
+
+
+# Test that failed generations are neither published nor stored
+def test_generation_error_fails_the_run(services, tmp_path):
+    openai, blog_post, tts = services
+    openai.return_value = 'Error: Request timed out - too slow'
+    state = PublishState(str(tmp_path / 'state.json'))
+
+    with pytest.raises(RuntimeError):
+        run(FakeSpotify(['a']), state, tmp_path)
+
+    assert state.get('blog/rock/2024-W21') == {}
+    blog_post.assert_not_called()
+
+
+# Test that an empty chart (a failed search) leaves the published week untouched
+def test_empty_chart_fails_the_run(services, tmp_path):
+    openai, blog_post, tts = services
+    state = PublishState(str(tmp_path / 'state.json'))
+    run(FakeSpotify(['a', 'b']), state, tmp_path)
+    published = state.get('blog/rock/2024-W21')
+
+    spotify = FakeSpotify([])
+    with pytest.raises(RuntimeError):
+        run(spotify, state, tmp_path)
+
+    assert state.get('blog/rock/2024-W21') == published
+    assert spotify.published_playlists == []
+    blog_post.return_value.update_post.assert_not_called()
+    tts.assert_called_once()
+
+
+# Test that the feed files link the playlist and are not written again for an unchanged chart
+def test_feed_files(services, tmp_path):
+    state = PublishState(str(tmp_path / 'state.json'))
+    spotify = FakeSpotify(['a'])
+    rss_path = tmp_path / 'Top Rock Songs for Week 21.rss.xml'
+
+    run(spotify, state, tmp_path)
+    assert '<link>https://open.spotify.com/playlist/1</link>' in rss_path.read_text()
+
+    rss_path.write_text('unchanged')
+    run(spotify, state, tmp_path)
+    assert rss_path.read_text() == 'unchanged'
+
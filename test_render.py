@@ -0,0 +1,62 @@
+import json
+from types import SimpleNamespace
+
+import render
+from render import render_tracks
+
+
+def make_track(name, artist='Artist', release_date='2024-05-01', description='Great song.'):
+    return SimpleNamespace(name=name, artist=artist, release_date=release_date, description=description)
+
+
+# Test that every format is rendered in list order
+def test_render_all_formats():
+    songs = [make_track('Song 1'), make_track('Song 2', description='Another one.')]
+
+    rendered = render_tracks(songs, introduction='Intro.', title='Top Songs')
+
+    assert rendered['html'] == ("<p>Intro.</p>"
+                                "<p><b>1 - Song 1</b> - <b>Artist</b> - Release date: 2024-05-01<br>\nGreat song.<br><br></p>"
+                                "<p><b>2 - Song 2</b> - <b>Artist</b> - Release date: 2024-05-01<br>\nAnother one.<br><br></p>")
+    assert rendered['text'] == "Intro.Great song.Another one."
+    assert rendered['markdown'].startswith("Intro.\n\n1. **Song 1** - **Artist**")
+    assert "<item><title>2 - Song 2 - Artist</title>" in rendered['rss']
+    feed = json.loads(rendered['json'])
+    assert feed['title'] == 'Top Songs'
+    assert [item['title'] for item in feed['items']] == ['1 - Song 1 - Artist', '2 - Song 2 - Artist']
+
+
+# Test that markup in the track fields is escaped
+def test_render_escapes_markup():
+    rendered = render_tracks([make_track('<b>Rock & Roll</b>', artist='AC*DC')])
+
+    assert '&lt;b&gt;Rock &amp; Roll&lt;/b&gt;' in rendered['html']
+    assert '&lt;b&gt;Rock &amp; Roll&lt;/b&gt;' in rendered['rss']
+    assert 'AC\\*DC' in rendered['markdown']
+
+
+# Test that a recurring song reuses its fragment at any position
+def test_fragments_are_memoized(mocker):
+    build = mocker.spy(render, 'TrackFragment')
+    song = make_track('Memoized Song')
+
+    first = render_tracks([song], formats=('html',))
+    second = render_tracks([make_track('Other Song'), make_track('Memoized Song')], formats=('html',))
+
+    assert build.call_count == 2
+    assert first['html'].startswith('<p><b>1 - Memoized Song')
+    assert '<p><b>2 - Memoized Song' in second['html']
+
+
+# Test that a recurring song reuses its fragment when its description was generated again
+def test_fragments_ignore_description(mocker):
+    build = mocker.spy(render, 'TrackFragment')
+    first = make_track('Weekly Song', description='Last week.')
+    second = make_track('Weekly Song', description='This week.')
+
+    render_tracks([first], formats=('html',))
+    rendered = render_tracks([second], formats=('html', 'json'))
+
+    assert build.call_count == 1
+    assert 'This week.' in rendered['html']
+    assert json.loads(rendered['json'])['items'][0]['content_text'] == 'This week.'
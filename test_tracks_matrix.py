@@ -0,0 +1,68 @@
+import os
+import datetime
+
+os.environ.setdefault('OPENAI_API_KEY', 'test-key')
+
+from spotify_rock_tracks import SpotifyRockTracks, authenticate_spotify
+
+
+def search_results(*track_ids):
+    return {'tracks': {'items': [{'id': track_id, 'name': f'Song {track_id}', 'artists': [{'name': 'Artist'}],
+                                  'popularity': 50, 'album': {'release_date': '2024-05-01'}}
+                                 for track_id in track_ids]}}
+
+
+# Test that tracks found in several cells are shared and described once, for the genre they were first found in
+def test_tracks_matrix_deduplicates(mocker, monkeypatch):
+    monkeypatch.setenv('SPOTIPY_CLIENT_ID', 'id')
+    monkeypatch.setenv('SPOTIPY_CLIENT_SECRET', 'secret')
+    cells = {
+        ('genre:"rock" year:2024', 'US'): search_results('a', 'b'),
+        ('genre:"rock" year:2024', 'ES'): search_results('b', 'c'),
+        ('genre:"metal" year:2024', 'US'): search_results('c', 'd'),
+        ('genre:"metal" year:2024', 'ES'): search_results('a'),
+    }
+    sp = mocker.patch('spotify_rock_tracks.authenticate_spotify').return_value
+    sp.search.side_effect = lambda q, type, limit, market: cells[(q, market)]
+    openai = mocker.patch('spotify_rock_tracks.get_openai_response', side_effect=lambda prompt: prompt)
+
+    matrix = SpotifyRockTracks(genres=['rock', 'metal'], markets=['US', 'ES']).get_tracks_matrix(year=2024)
+
+    assert [song.track_id for song in matrix[('metal', 'ES')]] == ['a']
+    assert matrix[('metal', 'ES')][0] is matrix[('rock', 'US')][0]
+    assert matrix[('rock', 'ES')][1] is matrix[('metal', 'US')][0]
+    assert openai.call_count == 4
+    descriptions = {song.track_id: song.description for songs in matrix.values() for song in songs}
+    assert 'top rock songs' in descriptions['c']
+    assert 'top metal songs' in descriptions['d']
+    assert 'song number' not in descriptions['a']
+
+
+# Test that the popularity is recorded under the week it was observed, not the queried week
+def test_history_records_observation_week(mocker, monkeypatch):
+    monkeypatch.setenv('SPOTIPY_CLIENT_ID', 'id')
+    monkeypatch.setenv('SPOTIPY_CLIENT_SECRET', 'secret')
+    sp = mocker.patch('spotify_rock_tracks.authenticate_spotify').return_value
+    sp.search.return_value = search_results('a')
+    history = mocker.Mock()
+
+    SpotifyRockTracks(history=history).search_rock_tracks_week_year(week_of_the_year=12, year=2020)
+
+    year, week_of_the_year, _ = datetime.date.today().isocalendar()
+    history.get.assert_called_once_with('rock')
+    record = history.get.return_value.record
+    record.assert_called_once()
+    assert record.call_args.args[1:] == (year, week_of_the_year)
+
+
+# Test that the pooled session keeps spotipy's retries of rate limited and failed requests
+def test_pooled_session_retries(monkeypatch):
+    monkeypatch.setenv('SPOTIPY_CLIENT_ID', 'id')
+    monkeypatch.setenv('SPOTIPY_CLIENT_SECRET', 'secret')
+    monkeypatch.setenv('SPOTIPY_REDIRECT_URI', 'http://localhost:8080/callback')
+    sp = authenticate_spotify(pool_size=8)
+
+    adapter = sp._session.get_adapter('https://api.spotify.com/v1/search')
+    assert adapter._pool_maxsize == 8
+    assert 429 in adapter.max_retries.status_forcelist
+    assert adapter.max_retries.total == 3